@@ -0,0 +1,75 @@
+# Copyright (c) 2025 Kevin Lin
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+'''
+Startup time benchmark.
+Each sample runs in a fresh interpreter and measures how long it takes to import
+bm, load the config and create the game, i.e. the time until the first turn can
+start. It also lists which heavy packages got imported on the way: batch mode
+should not import rich or the TTS stack at all. In show mode the Kokoro model
+loads on the TTS worker thread, so the time until it is ready is reported
+separately and is not part of the startup time.
+'''
+
+HEAVY_MODULES = ["rich", "tts", "kokoro", "torch", "numpy", "soundfile", "openai", "ollama", "pydantic", "httpx"]
+
+SAMPLE = '''
+import sys, json, time, os
+start = time.perf_counter()
+import bm
+imported = time.perf_counter()
+players = bm.make_players(bm.load_config({config!r}))
+show_context = None
+if {show!r}:
+    from display import get_show_context
+    show_context = get_show_context(agent_mode=False, lang=bm.Language)
+game = bm.GameProg(players, show_context=show_context)
+ready = time.perf_counter()
+tts_ready = None
+if game._tts is not None:
+    game._tts.ready.wait()
+    tts_ready = time.perf_counter() - start
+print(json.dumps({{
+    "import": imported - start,
+    "startup": ready - start,
+    "tts_ready": tts_ready,
+    "modules": [m for m in {heavy!r} if m in sys.modules],
+}}))
+os._exit(0)
+'''
+
+def run_sample(config, show):
+    env = dict(os.environ)
+    env.setdefault("OPENROUTER_API_KEY", "benchmark") # clients are created but never called
+    code = SAMPLE.format(config=config, show=show, heavy=HEAVY_MODULES)
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="BluffMind startup time benchmark")
+    parser.add_argument('-c', '--config', type=str, default='config.json', help='Configuration file for players')
+    parser.add_argument('-n', '--runs', type=int, default=5, help='Fresh interpreters per mode')
+    parser.add_argument('--show', action='store_true', help='Also measure show mode (needs rich and kokoro)')
+    args = parser.parse_args()
+
+    modes = [("batch", False)] + ([("show", True)] if args.show else [])
+    for name, show in modes:
+        samples = [run_sample(args.config, show) for _ in range(args.runs)]
+        line = f"{name:5s}  import {1000 * median([s['import'] for s in samples]):7.1f} ms" \
+               f"  startup {1000 * median([s['startup'] for s in samples]):7.1f} ms"
+        if show:
+            line += f"  tts ready {1000 * median([s['tts_ready'] for s in samples]):7.1f} ms"
+        print(line)
+        print(f"       heavy modules imported: {', '.join(samples[-1]['modules']) or 'none'}")
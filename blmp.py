@@ -4,90 +4,415 @@
 # LICENSE file in the root directory of this source tree.
 
 import os
+import time
+import asyncio
+import threading
+import weakref
+import contextvars
 from enum import Enum
-from ollama import chat as ollama_chat
-from openai import OpenAI
-from openai import InternalServerError
-from dotenv import load_dotenv
-import json
 
-class APIType(Enum):
-    OPENROUTER = "openrouter"
-    OLLAMA = "ollama"
-from enum import Enum
-from ollama import chat as ollama_chat
-from openai import OpenAI
-from openai import InternalServerError
-from dotenv import load_dotenv
-import json
+from log import log_message
+from retry import RetryPolicy, retry_call, aretry_call
+from ratelimit import estimate_tokens
+from metrics import observe
+from profiler import phase
+
+'''
+The openai, ollama, httpx and dotenv packages are only imported once a client for
+their backend is created, so a game that only uses one backend (or none, with
+"Random" players) never pays for importing the others.
+'''
 
 class APIType(Enum):
     OPENROUTER = "openrouter"
     OLLAMA = "ollama"
 
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+
+# perf_counter() when the response headers of the current request arrived, set by the HTTP clients' hooks
+_FIRST_BYTE = contextvars.ContextVar("first_byte", default=None)
+
+def _mark_first_byte(response):
+    _FIRST_BYTE.set(time.perf_counter())
+
+async def _amark_first_byte(response):
+    _FIRST_BYTE.set(time.perf_counter())
+
+def _pool_limits():
+    # Connection pool limits for the shared HTTP clients
+    import httpx
+    return httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30)
+
+'''
+HTTP clients are shared per base URL (per host for Ollama), so all players, the
+dealer and all games in a process reuse one keep-alive connection pool.
+Async clients are bound to the event loop they were created in, so they are
+kept per event loop, along with the HTTP connections they were given, which
+aclose_shared_clients closes.
+'''
+_CLIENTS = {}
+_ASYNC_CLIENTS = weakref.WeakKeyDictionary()
+_CLIENTS_LOCK = threading.Lock()
+
+def _shared_client(api_type, base_url, api_key=None):
+    key = (api_type, base_url, api_key)
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(key)
+        if client is None:
+            if api_type == APIType.OPENROUTER:
+                import httpx
+                from openai import OpenAI
+                client = OpenAI(base_url=base_url, api_key=api_key, max_retries=0, # retried by the RetryPolicy
+                                http_client=httpx.Client(limits=_pool_limits(), event_hooks={"response": [_mark_first_byte]}))
+            else:
+                from ollama import Client as OllamaClient
+                client = OllamaClient(host=base_url, event_hooks={"response": [_mark_first_byte]})
+            _CLIENTS[key] = client
+    return client
+
+def _shared_async_client(api_type, base_url, api_key=None):
+    clients = _ASYNC_CLIENTS.setdefault(asyncio.get_running_loop(), {})
+    key = (api_type, base_url, api_key)
+    if key not in clients:
+        import httpx
+        if api_type == APIType.OPENROUTER:
+            from openai import AsyncOpenAI
+            connections = httpx.AsyncClient(limits=_pool_limits(), event_hooks={"response": [_amark_first_byte]})
+            client = AsyncOpenAI(base_url=base_url, api_key=api_key, max_retries=0, http_client=connections)
+        else:
+            from ollama import AsyncClient as AsyncOllamaClient
+            # ollama builds its own httpx client from these arguments, so it is given the transport
+            connections = httpx.AsyncHTTPTransport(limits=_pool_limits())
+            client = AsyncOllamaClient(host=base_url, transport=connections, event_hooks={"response": [_amark_first_byte]})
+        clients[key] = (client, connections)
+    return clients[key][0]
+
+async def aclose_shared_clients():
+    """
+    Close the async clients of the running event loop. Call before the loop exits.
+    """
+    clients = _ASYNC_CLIENTS.pop(asyncio.get_running_loop(), {})
+    for _, connections in clients.values():
+        await connections.aclose()
+
+# Process-wide response cache used by clients that don't set their own, see cache.py
+_RESPONSE_CACHE = None
+
+def set_response_cache(cache):
+    global _RESPONSE_CACHE
+    _RESPONSE_CACHE = cache
+
+# Process-wide retry policy used by clients that don't set their own, see retry.py
+_RETRY_POLICY = RetryPolicy()
+
+def set_retry_policy(policy):
+    global _RETRY_POLICY
+    _RETRY_POLICY = policy
+
+# Process-wide rate limiter shared by all clients, see ratelimit.py. None for no limits.
+_RATE_LIMITER = None
+
+def set_rate_limiter(limiter):
+    global _RATE_LIMITER
+    _RATE_LIMITER = limiter
+
+# Prices in dollars per million tokens by model, {"model": {"prompt": 0.3, "completion": 2.5}},
+# for models whose responses don't report their cost
+_PRICES = {}
+
+def set_prices(prices):
+    global _PRICES
+    _PRICES = prices
+
+def _usage(response):
+    """
+    (prompt tokens, completion tokens, cost or None) as reported in a response, or None.
+    """
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        return usage.prompt_tokens or 0, usage.completion_tokens or 0, getattr(usage, "cost", None)
+    prompt, completion = getattr(response, "prompt_eval_count", None), getattr(response, "eval_count", None)
+    if prompt is None and completion is None:
+        return None
+    return prompt or 0, completion or 0, None
+
+def _error_result(e):
+    """
+    (code, error) for a failed request: the HTTP status code, or -1 if there was
+    none, and a dict with at least a message.
+    """
+    body = getattr(e, "body", None)
+    if not isinstance(body, dict) or "message" not in body:
+        body = {"message": str(e)}
+    return getattr(e, "status_code", None) or -1, body
+
 class BLMPClient:
-    def __init__(self, api_type=APIType.OPENROUTER, model=None):
+    def __init__(self, api_type=APIType.OPENROUTER, model=None, cache=None, base_url=None, retry=None):
         self.api_type = api_type
+        self._cache = cache
+        self._retry = retry
         if api_type == APIType.OPENROUTER:
             try:
                 api_key=os.environ["OPENROUTER_API_KEY"]
             except KeyError:
+                from dotenv import load_dotenv
                 load_dotenv()
                 api_key = os.environ.get("OPENROUTER_API_KEY")
                 if not api_key:
                     raise ValueError("OPENROUTER_API_KEY not found in environment variables or .env file.")
-            self.client = OpenAI(
-                base_url="https://openrouter.ai/api/v1",
-                api_key=api_key
-            )
+            self.api_key = api_key
+            self.base_url = base_url or os.environ.get("OPENROUTER_BASE_URL", OPENROUTER_BASE_URL)
+            self.client = _shared_client(api_type, self.base_url, self.api_key)
             self.model = "meta-llama/llama-3.3-8b-instruct:free" if model is None else model
             return
         elif api_type == APIType.OLLAMA:
+            self.api_key = None
+            self.base_url = base_url # None uses OLLAMA_HOST or the local default
+            self.client = _shared_client(api_type, self.base_url)
             self.model = "llama3.2" if model is None else model
             return
 
     def set_model(self, model):
         self.model = model
 
-    def complete_chat(self, messages, response_format=None):
+    @property
+    def retry(self):
+        return self._retry if self._retry is not None else _RETRY_POLICY
+
+    def _log_retry(self, attempt, e, delay):
+        log_message(f"{self.model} request failed ({e}), retry {attempt + 1} in {delay:.2f}s")
+
+    def _record(self, seconds, stats):
+        """
+        Record the metrics of a finished call, see metrics.py. The caller tags role, player and round.
+        """
+        observe("llm_call_seconds", seconds, model=self.model)
+        observe("llm_retries", stats["retries"], model=self.model)
+        observe("llm_errors", int("error" in stats), model=self.model)
+        if stats.get("ttfb") is not None:
+            observe("llm_ttfb_seconds", stats["ttfb"], model=self.model)
+        if stats.get("usage") is not None:
+            prompt, completion, cost = stats["usage"]
+            if cost is None:
+                price = _PRICES.get(self.model, {})
+                cost = (prompt * price.get("prompt", 0) + completion * price.get("completion", 0)) / 1e6
+            observe("llm_prompt_tokens", prompt, model=self.model)
+            observe("llm_completion_tokens", completion, model=self.model)
+            observe("llm_cost_dollars", cost, model=self.model)
+
+    def _call(self, request, deadline):
+        """
+        Run request(timeout, stats) under the retry policy and record the call's metrics.
+        Raises the last error once the policy gives up.
+        """
+        stats = {"retries": 0}
+        def on_retry(attempt, e, delay):
+            stats["retries"] += 1
+            self._log_retry(attempt, e, delay)
+        start = time.perf_counter()
+        try:
+            with phase("llm_wait"):
+                return retry_call(lambda timeout: request(timeout, stats), self.retry, deadline, on_retry)
+        except Exception as e:
+            stats["error"] = e
+            raise
+        finally:
+            self._record(time.perf_counter() - start, stats)
+
+    async def _acall(self, request, deadline):
+        stats = {"retries": 0}
+        def on_retry(attempt, e, delay):
+            stats["retries"] += 1
+            self._log_retry(attempt, e, delay)
+        start = time.perf_counter()
+        try:
+            return await aretry_call(lambda timeout: request(timeout, stats), self.retry, deadline, on_retry)
+        except Exception as e:
+            stats["error"] = e
+            raise
+        finally:
+            self._record(time.perf_counter() - start, stats)
+
+    @property
+    def cache(self):
+        return self._cache if self._cache is not None else _RESPONSE_CACHE
+
+    def _cache_key(self, kind, messages, extra):
+        if self.cache is None:
+            return None
+        return self.cache.key(kind, self.api_type.value, self.model, messages, extra)
+
+    def _cached_message(self, key):
+        data = self.cache.get(key) if key is not None else None
+        if data is None:
+            return None
         if self.api_type == APIType.OPENROUTER:
-            try:
-                response = self.client.chat.completions.create(
-                        model=self.model,
-                        messages=messages,
-                        response_format=response_format
-                    ) if response_format is not None else self.client.chat.completions.create(
-                        model=self.model,
-                        messages=messages
-                    )
-                return 0, response.choices[0].message.content
-            except Exception as e:
-                print(e)
-                if hasattr(e, 'status_code'):  # Check for HTTP status code
-                    return e.status_code, json.loads(str(e.body).translate(str.maketrans({"'": '"', '"': "'"})))
-                else:
-                    return -1, {"message": f"Non-HTTP error occurred: {str(e)}"}
-        elif self.api_type == APIType.OLLAMA:
-            try:
-                response = ollama_chat(self.model, messages=messages, format=response_format) \
-                    if response_format is not None else ollama_chat(self.model, messages=messages)
-                return 0, response['message']['content']
-            except Exception as e: # change to ollama specific exception
-                print(e)
-                return 1, str(e)
-    
-    def f_call(self, messages, tools=None):
+            from openai.types.chat import ChatCompletionMessage
+            return ChatCompletionMessage.model_validate(data)
+        from ollama import Message as OllamaMessage
+        return OllamaMessage.model_validate(data)
+
+    @property
+    def aclient(self):
+        return _shared_async_client(self.api_type, self.base_url, self.api_key)
+
+    def _reserve(self, messages, extra, timeout, stats):
+        """
+        Reserve the request from the rate limiter. Returns (seconds to wait, timeout left after waiting).
+        """
+        if _RATE_LIMITER is None:
+            stats["reserved"] = 0
+            return 0.0, timeout
+        stats["reserved"] = tokens = estimate_tokens(messages, extra)
+        wait = _RATE_LIMITER.acquire(self.api_type.value, self.model, tokens, timeout)
+        return wait, (timeout - wait if timeout is not None else None)
+
+    def _throttle(self, messages, extra, timeout, stats):
+        """
+        Wait for the rate limiter, then note when the request is sent. Returns the timeout left.
+        """
+        wait, timeout = self._reserve(messages, extra, timeout, stats)
+        if wait > 0:
+            with phase("rate_limit_wait"):
+                time.sleep(wait)
+        _FIRST_BYTE.set(None)
+        stats["sent"] = time.perf_counter()
+        return timeout
+
+    async def _athrottle(self, messages, extra, timeout, stats):
+        wait, timeout = self._reserve(messages, extra, timeout, stats)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        _FIRST_BYTE.set(None)
+        stats["sent"] = time.perf_counter()
+        return timeout
+
+    def _finish(self, response, stats):
+        """
+        Note the time to first byte and usage of a response, and settle its rate limit reservation.
+        """
+        first_byte = _FIRST_BYTE.get()
+        stats["ttfb"] = first_byte - stats["sent"] if first_byte is not None else None
+        stats["usage"] = usage = _usage(response)
+        if _RATE_LIMITER is not None and usage is not None:
+            _RATE_LIMITER.settle(self.api_type.value, self.model, usage[0] + usage[1] - stats["reserved"])
+        return response
+
+    def _chat_kwargs(self, messages, response_format, timeout=None):
+        kwargs = {"model": self.model, "messages": messages}
+        if response_format is not None:
+            if self.api_type == APIType.OPENROUTER:
+                kwargs["response_format"] = response_format
+            else:
+                kwargs["format"] = response_format
+        if timeout is not None and self.api_type == APIType.OPENROUTER:
+            kwargs["timeout"] = timeout # the ollama client has no per request timeout
+        return kwargs
+
+    def _chat(self, messages, response_format, timeout, stats):
+        timeout = self._throttle(messages, response_format, timeout, stats)
+        kwargs = self._chat_kwargs(messages, response_format, timeout)
         if self.api_type == APIType.OPENROUTER:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                tools=tools
-            ).choices[0].message
+            return self._finish(self.client.chat.completions.create(**kwargs), stats).choices[0].message.content
+        return self._finish(self.client.chat(**kwargs), stats)['message']['content']
+
+    async def _achat(self, messages, response_format, timeout, stats):
+        timeout = await self._athrottle(messages, response_format, timeout, stats)
+        kwargs = self._chat_kwargs(messages, response_format, timeout)
+        if self.api_type == APIType.OPENROUTER:
+            return self._finish(await self.aclient.chat.completions.create(**kwargs), stats).choices[0].message.content
+        return self._finish(await self.aclient.chat(**kwargs), stats)['message']['content']
+
+    def _cached_content(self, key, refresh):
+        """
+        The cached content for key, or None. refresh skips the lookup, except in
+        replay mode where there is nothing else to answer with.
+        """
+        if key is None or (refresh and self.cache.mode != "replay"):
+            return None
+        return self.cache.get(key)
 
+    def complete_chat(self, messages, response_format=None, deadline=None, refresh=False):
+        """
+        Return (0, content), or (code, error) once the retry policy gives up or,
+        in replay mode, the response is not cached. deadline is a time.monotonic()
+        value that bounds all attempts. refresh asks the model again instead of
+        returning the cached answer, e.g. after an invalid one, and caches the new one.
+        """
+        key = self._cache_key("chat", messages, response_format)
+        try:
+            if (content := self._cached_content(key, refresh)) is not None:
+                return 0, content
+            content = self._call(lambda timeout, stats: self._chat(messages, response_format, timeout, stats), deadline)
+        except Exception as e:
+            return _error_result(e)
+        if key is not None:
+            self.cache.put(key, content)
+        return 0, content
+
+    async def acomplete_chat(self, messages, response_format=None, deadline=None, refresh=False):
+        key = self._cache_key("chat", messages, response_format)
+        try:
+            if (content := self._cached_content(key, refresh)) is not None:
+                return 0, content
+            content = await self._acall(lambda timeout, stats: self._achat(messages, response_format, timeout, stats), deadline)
+        except Exception as e:
+            return _error_result(e)
+        if key is not None:
+            self.cache.put(key, content)
+        return 0, content
+
+    def _tool_kwargs(self, messages, tools, timeout):
+        kwargs = {"model": self.model, "messages": messages, "tools": tools}
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        return kwargs
+
+    def _tool_call(self, messages, tools, timeout, stats):
+        timeout = self._throttle(messages, tools, timeout, stats)
+        if self.api_type == APIType.OPENROUTER:
+            response = self.client.chat.completions.create(**self._tool_kwargs(messages, tools, timeout))
+            return self._finish(response, stats).choices[0].message
+        return self._finish(self.client.chat(self.model, messages=messages, tools=tools), stats)['message']
+
+    async def _atool_call(self, messages, tools, timeout, stats):
+        timeout = await self._athrottle(messages, tools, timeout, stats)
+        if self.api_type == APIType.OPENROUTER:
+            response = await self.aclient.chat.completions.create(**self._tool_kwargs(messages, tools, timeout))
+            return self._finish(response, stats).choices[0].message
+        return self._finish(await self.aclient.chat(self.model, messages=messages, tools=tools), stats)['message']
+
+    def f_call(self, messages, tools=None, deadline=None):
+        """
+        Return the response message. Raises the last error once the retry policy gives up.
+        """
+        key = self._cache_key("tools", messages, tools)
+        if (response := self._cached_message(key)) is not None:
             return response
-        elif self.api_type == APIType.OLLAMA:
-            response = ollama_chat(self.model, messages=messages, tools=tools)
-            return response['message']
+        response = self._call(lambda timeout, stats: self._tool_call(messages, tools, timeout, stats), deadline)
+        if key is not None:
+            self.cache.put(key, response.model_dump())
+        return response
+
+    async def af_call(self, messages, tools=None, deadline=None):
+        key = self._cache_key("tools", messages, tools)
+        if (response := self._cached_message(key)) is not None:
+            return response
+        response = await self._acall(lambda timeout, stats: self._atool_call(messages, tools, timeout, stats), deadline)
+        if key is not None:
+            self.cache.put(key, response.model_dump())
+        return response
+
+    def warmup(self):
+        """
+        Load the model ahead of the first request. Only does something for Ollama,
+        which otherwise loads the model into memory on the first chat.
+        """
+        if self.api_type == APIType.OLLAMA:
+            try:
+                self.client.generate(model=self.model, prompt="")
+            except Exception as e:
+                print(f"Ollama warmup of {self.model} failed: {e}")
 
     def __str__(self):
         return self.model
@@ -110,5 +435,3 @@ def message_to_string(message):
         return "\n".join([message_to_string(m) for m in message])
     else:
         raise ValueError(f"Unsupported message type: {type(message)}")
-
-
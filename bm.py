@@ -7,29 +7,87 @@ import random
 import json
 import argparse
 from time import sleep
-from pydantic import BaseModel
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
-from display import make_screen
 from blmp import *
-from log import log_message, log_start, log_end
+from log import log_message, log_event, log_start, log_end
+from events import EventLog
+from odds import honest_probability, odds_hint
+from retry import RetryPolicy, repair_json
+from ratelimit import RateLimiter
+from dealer import DealerContext
+from metrics import REGISTRY as METRICS, tagged
+from profiler import PROFILER, phase
+from state import Hand, PlayerState, GameState, CARD_INDEX, encode_move, legal_plays
 
 '''
-Game state contains the public state of the game. 
+Game state contains the public state of the game, as a log of typed events (see events.py). 
 It is used to display the game state on the screen and to provide context for the players.
 It should not contain any private information about the players, such as their cards or their mind.
+Every game keeps its own log (BaseGame.events), shared with its players.
 '''
-global GAME_STATE
-GAME_STATE = ""
 
 Language = "a"  # Default language is English
 LangName = "English"  # Default language name is English
 
-def update_game_state(msg):
-    global GAME_STATE
-    GAME_STATE += msg + "\n"
-    log_message(msg) 
-
 Announcer_voice = "am_eric"  # Default announcer voice
+Audio_sink = "stream"  # Where show mode speech goes, see tts.AUDIO_SINKS
+Voice_cache = None  # Directory keeping synthesized lines across runs
+RANDOM_THINK_TIME = 1  # Seconds a bot player pauses before playing, for pacing in show mode
+BOT_MODELS = ["Random", "Odds", "Strategy"]  # Model names played by built-in bots instead of an LLM
+STRATEGY_FILE = "strategy.bin"  # Solved table of the "Strategy" bot, see strategy.py
+TURN_DEADLINE = 60  # Seconds an LLM player has for a valid move, retries included
+INVALID_MOVE_RETRIES = 2  # Times an LLM player is asked again after an invalid move
+FALLBACK_MODEL = "Odds"  # Bot that moves for an LLM player without a valid move in time
+DEALER_RETRY = RetryPolicy(attempts=8, base_delay=1.0, max_delay=30.0)  # The dealer has no fallback, so it waits longer
+METRICS_FILE = None  # Prometheus text file written at every round start and at the end of the game
+PROFILE_FILE = None  # Collapsed stack file of the phase profiler written at the end of the game, see profiler.py
+DEALER_WINDOW = 16  # Most recent dealer exchanges sent on each dealer call, see dealer.py
+DEALER_MAX_TOKENS = 4000  # Token budget of each dealer call
+ODDS_HINT = True  # Tell LLM players the exact odds of the last claim, see odds.py
+MAX_HISTORY_EVENTS = None  # Most recent game events in a player's prompt, None for all of them
+
+# Announcer lines, [English, Chinese]. Most are spoken, so they are also pre-synthesized at game start, see announcer_lines
+JoinedGame = ["{player} has joined the game.", "{player} 来了"]
+StartingRound = ["Starting round {round} with table card {table_card}", "开始第{round}轮"]
+PlayerTurn = ["{player}'s turn...", "轮到{player}出牌了..."]
+Challenges = ["{player} challenges {last_player}!", "{player} 挑战 {last_player}!"]
+ChallengeTaunt = ["I challenge {last_player}.", "我要挑战{last_player}."]
+ChallengeFailed = ["Challenge failed! All cards match the table card.", "挑战失败！所有的牌都匹配桌面牌。"]
+ChallengeSucceeded = ["Challenge successful! Not all cards match the table card.", "挑战成功！不是所有的牌都匹配桌面牌。"]
+PlaysRR = ["{player} will now play Russian Roulette!", "{player} 朝自己开了一枪！"]
+Killed = ["{player} was killed!", "{player} 完蛋了!"]
+Survived = ["{player} survived!", "{player} 逃过了!"]
+Wins = ["{player} wins the game.", "{player} 赢了游戏."]
+WARMUP_ROUNDS = 6 # Rounds whose start is pre-synthesized
+
+def announcement(template, **kwargs):
+    return template[0 if Language == "a" else 1].format(**kwargs)
+
+def announcer_lines(players):
+    """
+    Return every fixed spoken line of a game with these players, as (voice, text, speed).
+    """
+    lines = []
+    for p in players:
+        lines.append((p.voice, announcement(JoinedGame, player=p.name), 1.0))
+        lines.append((Announcer_voice, announcement(PlayerTurn, player=p), 1.0))
+        for line in [PlaysRR, Killed, Survived]:
+            lines.append((Announcer_voice, announcement(line, player=p), 1.0))
+        lines.append((Announcer_voice, announcement(Wins, player=p.name), 1.0))
+        for last in players:
+            if last is not p:
+                lines.append((Announcer_voice, announcement(Challenges, player=p, last_player=last), 1.0))
+                lines.append((p.voice, announcement(ChallengeTaunt, last_player=last), 1.0))
+    lines.append((Announcer_voice, announcement(ChallengeFailed), 1.0))
+    lines.append((Announcer_voice, announcement(ChallengeSucceeded), 1.0))
+    for round_number in range(1, WARMUP_ROUNDS + 1):
+        for table_card in ['Q', 'K', 'A']:
+            lines.append((Announcer_voice, announcement(StartingRound, round=round_number, table_card=table_card), 1.0))
+    return list(dict.fromkeys(lines))
 
 BLUFF_MIND_RULES = """
 Bluff Mind is a card game.
@@ -72,17 +130,82 @@ Play the game of Bluff Mind as if you are in the game. You must follow the
 system instructions and the rules of the game.
 """
 
+# Fixed fragments of the per-turn player prompt
+TURN_PROMPT_HEADER = "This is the current state of the game you are in:\n"
+TURN_PROMPT_QUESTION = (
+    "Think about your next move and give the reason for your decision."
+    + "What is your move? Please challenge or play 1 to 3 cards from your hand.\n"
+)
+TURN_PROMPT_NO_LAST_PLAYER = "There is no last player, so you cannot challenge anyone.\n"
+
 AGG_LEVEL_EXPLANATION = """
 The number represents how likely you are to challenge or bluff. 
 0 means you should never challenge the last player nor bluff.
 99 means you should always challenge the last player or bluff.
 """
 
-class PlayerResponse(BaseModel):
-    reason: str
-    move: str
-    played_cards: list[str]
-    taunt: str
+PLAY_SEPARATOR = ", " # between the cards of a play in the turn schema
+
+@lru_cache(maxsize=1024)
+def _turn_schema(cards, can_challenge, lang_name):
+    return {
+        "type": "object",
+        "properties": {
+            "reason": {
+                "type": "string",
+                "description": f"The reason for playing the selected cards or challenging, in {lang_name}."
+            },
+            "move": {
+                "type": "string",
+                "enum": (["CHALLENGE"] if can_challenge else []) + ["PLAY"],
+                "description": "The move to make. Either 'CHALLENGE' or 'PLAY'. If 'CHALLENGE', the player is challenging the last player. If 'PLAY', the player is playing cards."
+            },
+            "played_cards": {
+                "type": "string",
+                "enum": [PLAY_SEPARATOR.join(play) for play in legal_plays(cards)],
+                "description": "The cards to play, one of the plays possible with your hand. Ignored if the move is 'CHALLENGE'."
+            },
+            "taunt": {
+                "type": "string",
+                "description": f"Optional taunt or comment in {lang_name} to say to the other players."
+            }
+        },
+        "required": ["move", "played_cards", "reason", "taunt"],
+        "additionalProperties": False
+    }
+
+def turn_schema(cards, can_challenge):
+    """
+    JSON schema of a player's response for this turn. It only admits legal moves:
+    CHALLENGE only if there is a last player, and played_cards only as one of the
+    plays possible with the hand. Schemas are cached per hand.
+    """
+    return _turn_schema(tuple(sorted(cards)), can_challenge, LangName)
+
+def parse_played_cards(played_cards):
+    """
+    Cards of a response, from a play of the turn schema or a plain list.
+    """
+    if isinstance(played_cards, str):
+        return [card.strip() for card in played_cards.split(",") if card.strip()]
+    if isinstance(played_cards, list):
+        return [str(card) for card in played_cards]
+    raise ValueError(f"invalid played_cards {played_cards!r}")
+
+class Move:
+    '''
+    A decided but not yet applied move of a player.
+    cards is empty for a challenge. Only public taunts are added to the game state.
+    '''
+    def __init__(self, move, cards, taunt, reason=None, last_player=None, log=None, public=False):
+        self.move = move
+        self.cards = cards
+        self.taunt = taunt
+        self.reason = reason
+        self.last_player = last_player
+        self.log = log
+        self.public = public
+        self.rng = None # the player's random source after deciding the move, see Player.decide_move
 
 class Player:
     def __init__(self, name, model, persona, voice, aggro=50):
@@ -95,6 +218,11 @@ class Player:
         self.dead_round = 0 # The round in which the player was killed
         self.cards = []
         self.last_played_cards = []
+        self.round_played_cards = [] # All cards played this round
+        self.players_alive = 0 # Players alive this round
+        self.round_number = 0
+        self.rng = random # Random source of the bots, set per game by BaseGame.start_game
+        self.events = None # The game's event log, set by BaseGame
         self.rr_position = None
         self.rr_played = 0
         self.alive = True
@@ -107,8 +235,15 @@ class Player:
     def __str__(self):
         return f"{self.name}"
     
-    def reset_rr(self):
-        self.rr_position = random.randint(1, 3)  # position in the Russian Roulette
+    def state(self):
+        """
+        The player's compact state, see state.py.
+        """
+        return PlayerState(Hand.from_cards(self.cards), Hand.from_cards(self.round_played_cards),
+                           self.rr_position or 0, self.rr_played, self.alive)
+
+    def reset_rr(self, rng=random):
+        self.rr_position = rng.randint(1, 3)  # position in the Russian Roulette
         self.rr_played = 0
 
     def shoot_rr(self):
@@ -119,7 +254,9 @@ class Player:
         # return False # auto force death on challenge for fast testing
         log_message(f"{self} is taking a shot in RR, position: {self.rr_position}, played: {self.rr_played}")
         self.rr_played += 1
-        if self.rr_played == self.rr_position:
+        survived = self.rr_played != self.rr_position
+        log_event("rr", player=self.name, position=self.rr_position, played=self.rr_played, survived=survived)
+        if not survived:
             log_message(f"{self} has been killed in RR!")
             return False
         else:
@@ -131,176 +268,259 @@ class Player:
         '''
         Return a list of cards played or an empty list if a challenge is issued
         '''
+        return self.commit_move(self.decide_move(last_player, table_card))
 
-        #Move this log to LM????
+    def decide_move(self, last_player, table_card):
+        '''
+        Decide the next move without changing the player or the game state, so it
+        can be decided ahead of time (see TurnPipeline). Returns a Move.
+        The bots draw from a copy of the player's random source, which only
+        commit_move makes the player's own, so a move decided ahead of time and
+        thrown away leaves no trace in a seeded game.
+        '''
         if len(self.cards) == 0:
-            log_message(f"{self} has no cards left to play, therefore must challenge.")
-            self.last_played_cards = []
-            return [], "I have no cards left to play, therefore must challenge."
-
-        if self.model == "Random":
-            self.last_played_cards, self.taunt = self._play_card_random(last_player, table_card)
-            return self.last_played_cards, self.taunt 
+            return Move("CHALLENGE", [], "I have no cards left to play, therefore must challenge.",
+                        log=f"{self} has no cards left to play, therefore must challenge.")
+
+        rng = random.Random()
+        rng.setstate(self.rng.getstate())
+        if self.model in BOT_MODELS:
+            if RANDOM_THINK_TIME > 0:
+                with phase("bot_think"):
+                    sleep(RANDOM_THINK_TIME)
+            move = self._bot_move(self.model, last_player, table_card, rng)
         else: 
-            self.last_played_cards, self.taunt = self._play_card_llm(last_player, table_card)
-            return self.last_played_cards, self.taunt
-        
-
-    def _play_card_llm(self, last_player, table_card):
-
-        self.mind = ""
-        
-        prompt = (
-            "This is the current state of the game you are in:\n"
-            + GAME_STATE + "\n"
-            + "Your cards are: " + str(self.cards) + "\n"
-            + "Think about your next move and give the reason for your decision."
-            + "What is your move? Please challenge or play 1 to 3 cards from your hand.\n"
-        )
+            move = self._play_card_llm(last_player, table_card, rng)
+        move.rng = rng
+        return move
 
-        if last_player is not None:
-            prompt += f"The last player was {last_player}. You can choose to challenge them. Do you want to challenge them? If so, do not play any cards, and provide a reason for your challenge.\n"
-        else:
-            prompt += "There is no last player, so you cannot challenge anyone.\n"
-        
-        if self.model.api_type == APIType.OPENROUTER:
-            response_format = {
-                "type": "json_schema",
-                "json_schema":{
-                    "name": "turn",
-                    "strict": True,
-                    "schema": {
-                        "type": "object",
-                        "properties": {
-                            "reason": {
-                                "type": "string",
-                                "description": f"The reason for playing the selected cards or challenging, in {LangName}."
-                            },
-                            "move": {
-                                "type": "string",
-                                "enum": ["CHALLENGE", "PLAY"],
-                                "description": "The move to make. Either 'CHALLENGE' or 'PLAY'. If 'CHALLENGE', the player is challenging the last player. If 'PLAY', the player is playing cards."
-                            },
-                            "played_cards": {
-                                "type": "array", 
-                                "items": {"type": "string"},
-                                "description": "List of cards to be played by the player. Must be a subset of the player's hand. List must be empty if the player chooses to challenge. Cards must be in format of 'Q', 'K', 'A', or 'Joker'." 
-                            },
-                            "taunt": {
-                                "type": "string",
-                                "description": f"Optional taunt or comment in {LangName} to say to the other players."
-                            }
-                        },
-                        "required": ["move", "played_cards", "reason", "taunt"]
-                    }
-                }
-            }
-        elif self.model.api_type == APIType.OLLAMA:
-            response_format = PlayerResponse.model_json_schema()
-
-        code, llm_move = self.model.complete_chat(self.model_messages + [user_message(prompt)], response_format=response_format)
+    def commit_move(self, move):
+        '''
+        Apply a decided move: update the hand, the public game state and the log.
+        Return the cards played and the taunt.
+        '''
+        if move.rng is not None:
+            self.rng.setstate(move.rng.getstate())
+        if move.log:
+            log_message(move.log)
+        if move.reason is not None:
+            self.mind = move.reason
+        if move.move == "CHALLENGE" and move.last_player is not None:
+            log_message(f"{self} has chosen to challenge {move.last_player}.")
+        if move.public and move.taunt != "":
+            msg = f"{self} says: {move.taunt}"
+            self.events.append("taunt", msg)
+            log_message(msg)
 
-        if code == 0:
+        for card in move.cards:
+            self.cards.remove(card)
+        self.round_played_cards.extend(move.cards)
+        if move.cards:
+            log_message(f"{self} has played card: {move.cards}, remaining cards: {self.cards}")
+        log_event("play", player=self.name, move=move.move, cards=move.cards, hand=self.cards, taunt=move.taunt)
+
+        self.last_played_cards = move.cards
+        self.taunt = move.taunt
+        return move.cards, move.taunt
+
+    def _play_card_llm(self, last_player, table_card, rng):
+
+        with phase("prompt_build"):
+            prompt = "".join([
+                TURN_PROMPT_HEADER,
+                self.events.render(), # cached, shared by all players
+                "\n",
+                "Your cards are: ", str(self.cards), "\n",
+                odds_hint(len(last_player.last_played_cards), table_card, self.cards, self.round_played_cards)
+                if ODDS_HINT and last_player is not None and last_player.last_played_cards else "",
+                TURN_PROMPT_QUESTION,
+                f"The last player was {last_player}. You can choose to challenge them. Do you want to challenge them? If so, do not play any cards, and provide a reason for your challenge.\n"
+                if last_player is not None else TURN_PROMPT_NO_LAST_PLAYER,
+            ])
+
+            schema = turn_schema(self.cards, last_player is not None)
+            if self.model.api_type == APIType.OPENROUTER:
+                response_format = {"type": "json_schema", "json_schema": {"name": "turn", "strict": True, "schema": schema}}
+            elif self.model.api_type == APIType.OLLAMA:
+                response_format = schema
+
+        deadline = time.monotonic() + TURN_DEADLINE
+        for attempt in range(1 + INVALID_MOVE_RETRIES):
+            start = time.perf_counter()
+            with tagged(role="player", player=self.name, round=self.round_number):
+                # a retry asks again instead of getting the cached invalid answer back
+                code, llm_move = self.model.complete_chat(self.model_messages + [user_message(prompt)],
+                                                          response_format=response_format, deadline=deadline,
+                                                          refresh=attempt > 0)
+            log_event("llm_call", role="player", player=self.name, model=str(self.model), code=code, attempt=attempt,
+                      seconds=round(time.perf_counter() - start, 4))
+            if code != 0:
+                # the client's retry policy has already retried what it could
+                error = f"LLM error, code {code}: {llm_move['message']}"
+                break
             try:
-                llm_move = json.loads(llm_move)
-            except Exception as e:
-                print("-- ERROR --")
-                print("Error parsing LLM response as JSON:", e)
-                print("LLM response:")
-                print(llm_move)
-                buffer = input("Check LLM error. Press Enter to continue...")
-                return self._play_card_llm(last_player, table_card)
-
-            played_cards = [] if llm_move["move"] == "CHALLENGE" else llm_move["played_cards"]
-            reason = llm_move["reason"]
-            taunt = llm_move["taunt"]
-        
-            self.mind = reason
-            
-            msg = f"{self} has performed {llm_move['move']} and played cards: {played_cards} with hand {self.cards}\n\n Reason: \n{reason}\n"
-            log_message(msg)
+                with phase("parse"):
+                    return self._parse_llm_move(llm_move, last_player, table_card)
+            except ValueError as e:
+                error = str(e)
+                log_message(f"{self} returned an invalid move: {error}")
+            if time.monotonic() >= deadline:
+                break
 
+        move = self._bot_move(FALLBACK_MODEL, last_player, table_card, rng)
+        move.log = f"{self} has no valid move from the LLM ({error}), playing {move.move} {move.cards} with the {FALLBACK_MODEL} policy."
+        log_event("fallback", player=self.name, model=str(self.model), policy=FALLBACK_MODEL, error=error)
+        return move
 
-            counts = {card: self.cards.count(card) for card in self.cards}
-            for card in played_cards:
-                if counts.get(card, 0) < 1:
-                    print(f"-- ERROR --")
-                    print(f"{self} attempted to play {played_cards} with hand {self.cards}.")
-                    buffer = input("Check LLM error. Press Enter to continue...")
-                    return self._play_card_llm(last_player, table_card)
-                counts[card] -= 1
-                
-            if llm_move["move"] == "CHALLENGE":
-                if len(played_cards) != 0:
-                    print(f"-- ERROR --")
-                    print(f"{self} attempted to challenge with played cards: {played_cards}.")
-                    buffer = input("Check LLM error. Press Enter to continue...")
-                    return self._play_card_llm(last_player, table_card)
-                if (last_player is None):
-                    print(f"-- ERROR --")
-                    print(f"{self} attempted to challenge without a last player.")
-                    buffer = input("Check LLM error. Press Enter to continue...")
-                    return self._play_card_llm(last_player, table_card)
-                else:
-                    log_message(f"{self} has chosen to challenge {last_player}.")
-                    if Language == "a":
-                        taunt = f"I challenge {last_player}."
-                    else:
-                        taunt += f"我要挑战{last_player}."
+    def _parse_llm_move(self, content, last_player, table_card):
+        """
+        Turn an LLM response into a Move. Raises ValueError if it is not a valid move.
+        """
+        llm_move = repair_json(content)
+        if llm_move is None:
+            raise ValueError(f"not a JSON object: {content!r}")
+        if llm_move.get("move") not in ("CHALLENGE", "PLAY"):
+            raise ValueError(f"unknown move {llm_move.get('move')!r}")
+
+        played_cards = [] if llm_move["move"] == "CHALLENGE" else parse_played_cards(llm_move.get("played_cards"))
+        reason = str(llm_move.get("reason", ""))
+        taunt = str(llm_move.get("taunt", ""))
+
+        # the turn schema only admits legal moves, this catches backends that do not enforce it
+        if (any(card not in CARD_INDEX for card in played_cards)
+                or not Hand.from_cards(self.cards).contains(Hand.from_cards(played_cards))
+                or (llm_move["move"] == "PLAY" and not 1 <= len(played_cards) <= 3)):
+            raise ValueError(f"cannot play {played_cards} with hand {self.cards}")
+
+        msg = f"{self} has performed {llm_move['move']} and played cards: {played_cards} with hand {self.cards}\n\n Reason: \n{reason}\n"
+
+        if llm_move["move"] == "CHALLENGE":
+            if last_player is None:
+                raise ValueError("challenged without a last player")
+            if Language == "a":
+                taunt = announcement(ChallengeTaunt, last_player=last_player)
             else:
-                if Language == "a":
-                    taunt += f" {len(played_cards)} {table_card}!" 
-                else:
-                    taunt += f" {len(played_cards)} 张!" 
-
-            if taunt != "":
-                update_game_state(f"{self} says: {taunt}")
-
-            for card in played_cards:
-                self.cards.remove(card)
-
-            log_message(f"{self} has played card: {played_cards}, remaining cards: {self.cards}")
-
-            self.last_played_cards = played_cards
-            return played_cards, taunt
+                taunt += announcement(ChallengeTaunt, last_player=last_player)
         else:
-            print("-- ERROR --")
-            print(f"LLM Error, Code {code}:")
-            print(llm_move['message'])
-            if metadata := llm_move.get("metadata", None):
-                print("Error Metadata:")
-                print(metadata)
-            print("Check LLM error. Quitting.")
-            exit() 
-        
-    def _play_card_random(self, last_player, table_card):
-        sleep(1)
-        if (last_player is not None) and (random.random() < (self.aggro / 100)):
-            log_message(f"{self} has chosen to challenge {last_player}.")
-            self.last_played_cards = []
-            return [], "I challenge the last player."
+            if Language == "a":
+                taunt += f" {len(played_cards)} {table_card}!" 
+            else:
+                taunt += f" {len(played_cards)} 张!" 
+
+        return Move(llm_move["move"], played_cards, taunt, reason=reason, last_player=last_player, log=msg, public=True)
+
+    def _bot_move(self, model, last_player, table_card, rng):
+        if model == "Random":
+            return self._play_card_random(last_player, table_card, rng)
+        elif model == "Odds":
+            return self._play_card_odds(last_player, table_card, rng)
+        elif model == "Strategy":
+            return self._play_card_strategy(last_player, table_card, rng)
+        raise ValueError(f"Invalid bot model: {model}. Supported models are: {', '.join(BOT_MODELS)}.")
+
+    def _play_card_random(self, last_player, table_card, rng):
+        if (last_player is not None) and (rng.random() < (self.aggro / 100)):
+            return Move("CHALLENGE", [], "I challenge the last player.", last_player=last_player)
         
         number_of_cards = len(self.cards)
         # Randomly pick a few cards (1 to number_of_cards)
-        npick = random.randint(1, min(3, min(3, number_of_cards)))
+        npick = rng.randint(1, min(3, min(3, number_of_cards)))
+        hand = self.cards.copy()
         picked_cards = []
         while npick > 0:
             # Randomly pick a card from the hand
-            card_index = random.randint(0, len(self.cards) - 1)
-            picked_cards.append(self.cards[card_index])
-            del self.cards[card_index]  # remove the card from hand
+            card_index = rng.randint(0, len(hand) - 1)
+            picked_cards.append(hand.pop(card_index))
             npick -= 1
 
-        log_message(f"{self} has played card: {picked_cards}, remaining cards: {self.cards}")
-        self.last_played_cards = picked_cards
-        return picked_cards, f"{len(picked_cards)} {table_card}"
+        return Move("PLAY", picked_cards, f"{len(picked_cards)} {table_card}")
+
+    def _play_card_odds(self, last_player, table_card, rng):
+        """
+        Challenge when the last claim is honest with probability below aggro / 100,
+        otherwise play up to 3 table cards and Jokers, or bluff with one card if there are none.
+        """
+        if last_player is not None and last_player.last_played_cards:
+            p = honest_probability(len(last_player.last_played_cards), table_card, self.cards, self.round_played_cards)
+            if p < self.aggro / 100:
+                return Move("CHALLENGE", [], "I challenge the last player.", last_player=last_player,
+                            reason=f"The claim is honest with probability {p:.0%}.")
+
+        picked_cards = [card for card in self.cards if card == table_card or card == "Joker"][:3]
+        if not picked_cards:
+            picked_cards = [rng.choice(self.cards)]
+        return Move("PLAY", picked_cards, f"{len(picked_cards)} {table_card}")
+
+    def _play_card_strategy(self, last_player, table_card, rng):
+        """
+        Play from the solved strategy table.
+        """
+        from strategy import load_table
+        matching = [card for card in self.cards if card == table_card or card == "Joker"]
+        other = [card for card in self.cards if card != table_card and card != "Joker"]
+        claim = len(last_player.last_played_cards) if last_player is not None else 0
+        move, h, b = load_table(STRATEGY_FILE).decide(
+            len(matching), len(other), sum(1 for card in self.round_played_cards if card == table_card or card == "Joker"),
+            claim, self.rr_played, last_player.rr_played if last_player is not None else 0, self.players_alive, rng)
+        if move == "CHALLENGE":
+            return Move("CHALLENGE", [], "I challenge the last player.", last_player=last_player)
+        picked_cards = sorted(matching, key=lambda card: card == "Joker")[:h] + rng.sample(other, b)
+        return Move("PLAY", picked_cards, f"{len(picked_cards)} {table_card}")
+
+class TurnPipeline:
+    '''
+    Decides the next player's move on a background thread as soon as the public
+    state is final, so the LLM round trip overlaps the current turn's speech and
+    rendering instead of adding to it. A prefetched move is only used if the
+    same player is asked to play against the same last player and nothing has
+    been added to the game state since; otherwise it is thrown away.
+    '''
+    def __init__(self, events):
+        self.events = events
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="turn")
+        self._pending = None # (key, future)
+
+    def _key(self, player, last_player, table_card):
+        return (player, last_player, table_card, len(self.events))
+
+    def prefetch(self, player, last_player, table_card):
+        self.discard()
+        future = self._executor.submit(player.decide_move, last_player, table_card)
+        self._pending = (self._key(player, last_player, table_card), future)
+
+    def take(self, player, last_player, table_card):
+        """
+        Return the player's move, prefetched if possible.
+        """
+        if self._pending is not None and self._pending[0] == self._key(player, last_player, table_card):
+            future = self._pending[1]
+            self._pending = None
+            with phase("prefetch_wait"):
+                return future.result()
+        if self._pending is not None:
+            log_message(f"Discarding prefetched move of {self._pending[0][0]}")
+        self.discard()
+        return player.decide_move(last_player, table_card)
+
+    def discard(self):
+        if self._pending is not None:
+            self._pending[1].cancel() # a request already in flight just finishes unused
+            self._pending = None
+
+    def close(self):
+        self.discard()
+        self._executor.shutdown(wait=False, cancel_futures=True)
 
 class BaseGame:
-    def __init__(self, players, show_context=None):
+    def __init__(self, players, show_context=None, seed=None, pipeline=None):
         self.all_players = players
         self.state = "initial"
         self.table_card = None
         self.show_context = show_context
+        self.seed = seed if seed is not None else random.randrange(2**32) # always known, so every game can be replayed
+        self.rng = random.Random(self.seed) # dealing, seating, table cards and RR positions
+        self.moves = [] # encoded moves in the order they were played, see state.encode_move
+        self.kill_order = [] # Players in the order they were killed
 
         self.round_number = 0
         self.players_in_round = []
@@ -308,23 +528,32 @@ class BaseGame:
         self.screen_message_type = "info" # info, play, challenge, survived, killed 
 
         self.agent_mode = False
+
+        self.events = EventLog(MAX_HISTORY_EVENTS) # public game state, shared with the players
+        for player in players:
+            player.events = self.events
+
+        # Decide moves ahead of time by default only in show mode, where there is speech to overlap
+        if pipeline is None:
+            pipeline = show_context is not None
+        self._pipeline = TurnPipeline(self.events) if pipeline else None
         
         if show_context is not None:
             from tts import VoiceTTS 
-            self._tts = VoiceTTS(lang=Language)
+            self._tts = VoiceTTS(lang=Language, sink=Audio_sink, cache_dir=Voice_cache)
         else:
             self._tts = None
 
     def start_game(self):
-        update_game_state(f"Game started with state: {self.state}")
+        if self._tts is not None:
+            self._tts.warmup(announcer_lines(self.all_players))
+        self.update_game_state(f"Game started with state: {self.state}")
         self.state = "running"
-        random.seed()
+        for player in self.all_players:
+            player.rng = random.Random(self.rng.getrandbits(64))
 
         for player in self.all_players:
-            if Language == "a":
-                msg = f"{player.name} has joined the game."
-            else:
-                msg = f"{player.name} 来了"
+            msg = announcement(JoinedGame, player=player.name)
             self.voice_say(player.voice, msg, speed=1.0)
             self.players_in_round.append(player)
             self.show_message(msg, voice=False)
@@ -332,7 +561,21 @@ class BaseGame:
 
         # reset RR for all players
         for player in self.all_players:
-            player.reset_rr()
+            player.reset_rr(self.rng)
+
+    def snapshot(self, last_player=None):
+        """
+        The whole game as a compact GameState, see state.py.
+        """
+        return GameState([p.state() for p in self.all_players],
+                         [self.all_players.index(p) for p in self.players_in_round],
+                         self.table_card, self.round_number,
+                         self.all_players.index(last_player) if last_player is not None else None,
+                         Hand.from_cards(last_player.last_played_cards) if last_player is not None else None)
+
+    def update_game_state(self, msg, kind="info"):
+        self.events.append(kind, msg)
+        log_message(msg)
 
     def round_order(self):
         """
@@ -340,7 +583,7 @@ class BaseGame:
         This is a random order of all alive players.
         """
         alive_players = [p for p in self.all_players if p.alive]
-        random.shuffle(alive_players)
+        self.rng.shuffle(alive_players)
         self.players_in_round = alive_players
         return
     
@@ -356,14 +599,46 @@ class BaseGame:
         Wait for the TTS system to finish speaking.
         """
         if self._tts is not None:
-            self._tts.wait()
+            with phase("audio_wait"):
+                self._tts.wait()
+
+    def take_turn(self, player, last_player):
+        """
+        Decide the player's move, prefetched if possible, and reveal it once the
+        announcer has finished speaking.
+        """
+        PROFILER.turn(f"round {self.round_number} {player}")
+        if self._pipeline is not None:
+            move = self._pipeline.take(player, last_player, self.table_card)
+        else:
+            move = player.decide_move(last_player, self.table_card)
+        self.wait_say()
+        self.moves.append(encode_move(move.cards))
+        return player.commit_move(move)
+
+    def prefetch_turn(self, player, last_player):
+        """
+        Start deciding the player's next move in the background. Only call this
+        once the public game state for the turn is final.
+        """
+        if self._pipeline is not None:
+            self._pipeline.prefetch(player, last_player, self.table_card)
+
+    def close(self):
+        """
+        Stop deciding moves ahead of time and stop the TTS worker, once the game is over.
+        """
+        if self._pipeline is not None:
+            self._pipeline.close()
+        if self._tts is not None:
+            self._tts.close()
 
     def update_screen(self):
         """
         Update the screen with the current game state.
         """
         if self.show_context is not None:
-            self.show_context.update(make_screen(self, self.agent_mode, lang=Language), refresh=True)
+            self.show_context.render(self)
 
     def show_message(self, msg, wait=True, msg_type="info", voice=True):
         """
@@ -379,20 +654,27 @@ class BaseGame:
             self.voice_say(Announcer_voice, msg, speed=1.0)
 
     def shuffle_cards(self):
-        deck = ['Joker'] * 2 + ['Q'] * 6 + ['K'] * 6 + ['A'] * 6 
-        random.shuffle(deck)
-        # each player gets 5 cards
-        i = 0
-        for player in self.all_players:
-            if player.alive:
-                # make a deep copy. [:] is a shallow copy
-                # player.cards will be modified during play. 
-                player.cards = deck[i:i + 5].copy() 
-                # sort the cards for better readability
-                player.cards.sort()
-                player.last_played_cards = []
-                i += 5
-                log_message(f"{player} has been dealt cards: {player.cards}")
+        self.write_metrics()
+        with phase("deal"):
+            deck = ['Joker'] * 2 + ['Q'] * 6 + ['K'] * 6 + ['A'] * 6 
+            self.rng.shuffle(deck)
+            # each player gets 5 cards
+            i = 0
+            alive = sum(1 for player in self.all_players if player.alive)
+            for player in self.all_players:
+                if player.alive:
+                    player.players_alive = alive
+                    player.round_number = self.round_number
+                    # make a deep copy. [:] is a shallow copy
+                    # player.cards will be modified during play. 
+                    player.cards = deck[i:i + 5].copy() 
+                    # sort the cards for better readability
+                    player.cards.sort()
+                    player.last_played_cards = []
+                    player.round_played_cards = []
+                    i += 5
+                    log_message(f"{player} has been dealt cards: {player.cards}")
+                    log_event("deal", player=player.name, cards=player.cards)
     
     def check_cards(self, cards):
         """
@@ -401,16 +683,11 @@ class BaseGame:
         """
         check = all((card == self.table_card or card == 'Joker') for card in cards)
         if check:
-            if Language == "a":
-                msg = "Challenge failed! All cards match the table card." 
-            else:
-                msg = "挑战失败！所有的牌都匹配桌面牌。"
+            msg = announcement(ChallengeFailed)
         else:
-            if Language == "a":
-                msg = "Challenge successful! Not all cards match the table card."
-            else:
-                msg = "挑战成功！不是所有的牌都匹配桌面牌。"
-        update_game_state(msg)
+            msg = announcement(ChallengeSucceeded)
+        log_event("challenge", cards=cards, table_card=self.table_card, succeeded=not check)
+        self.update_game_state(msg, kind="challenge")
         self.show_message(msg, msg_type="challenge")
         return check
 
@@ -419,29 +696,21 @@ class BaseGame:
         Play Russian Roulette with the given player.
         Return True if the player is killed, False if the player survives.
         '''
-        if Language == "a":
-            msg = f"{player} will now play Russian Roulette!"
-        else:
-            msg = f"{player} 朝自己开了一枪！"
-        update_game_state(msg)
+        msg = announcement(PlaysRR, player=player)
+        self.update_game_state(msg, kind="rr")
         self.show_message(msg, msg_type="rr")
 
         if player.shoot_rr() is False:
-            if Language == "a":
-                msg = f"{player} was killed!"
-            else:
-                msg = f"{player} 完蛋了!"
-            update_game_state(msg)
+            msg = announcement(Killed, player=player)
+            self.update_game_state(msg, kind="rr")
             self.show_message(msg, msg_type="killed")
             player.alive = False
             player.dead_round = self.round_number
+            self.kill_order.append(player)
             return True
         else:
-            if Language == "a":
-                msg = f"{player} survived!"
-            else:
-                msg = f"{player} 逃过了!"
-            update_game_state(msg)
+            msg = announcement(Survived, player=player)
+            self.update_game_state(msg, kind="rr")
             self.show_message(msg, msg_type="survived")
             return False 
         
@@ -450,19 +719,51 @@ class BaseGame:
         log_message("Game report:")
         for player in self.all_players:
             if player.alive:
-                if Language == "a":
-                    msg = f"{player.name} wins the game."
-                else:
-                    msg = f"{player.name} 赢了游戏."
+                msg = announcement(Wins, player=player.name)
                 self.show_message(msg)
-                update_game_state(msg)
+                self.update_game_state(msg)
                 self.wait_say()
             else:
                 log_message(f"{player} has been killed.")
+        for line in METRICS.report():
+            log_message(f"Metrics: {line}")
+        self.write_metrics()
+        self.write_profile()
+
+    def write_metrics(self):
+        if METRICS_FILE is not None:
+            METRICS.write_prometheus(METRICS_FILE)
+
+    def write_profile(self):
+        """
+        Log the per-turn critical path breakdown and write the collapsed stacks, if profiling.
+        """
+        if not PROFILER.enabled:
+            return
+        for line in PROFILER.turn_report():
+            log_message(f"Profile: {line}")
+        if PROFILE_FILE is not None:
+            PROFILER.write_collapsed(PROFILE_FILE)
+            log_message(f"Profile: collapsed stacks written to {PROFILE_FILE}")
+
+    def result(self):
+        """
+        Return a summary of a finished game that can be serialized to JSON.
+        """
+        winners = [p.name for p in self.all_players if p.alive]
+        return {
+            "seed": self.seed,
+            "players": [p.name for p in self.all_players],
+            "moves": " ".join(self.moves),
+            "winner": winners[0] if len(winners) == 1 else None,
+            "rounds": self.round_number,
+            "kill_order": [p.name for p in self.kill_order],
+            "rr_shots": {p.name: p.rr_played for p in self.all_players},
+        }
 
 class GameProg(BaseGame):
-    def __init__(self, players, show_context=None):
-        super().__init__(players, show_context=show_context)
+    def __init__(self, players, show_context=None, seed=None):
+        super().__init__(players, show_context=show_context, seed=seed)
 
     def play(self):
         self.start_game()
@@ -487,11 +788,10 @@ class GameProg(BaseGame):
 
         self.round_number += 1
 
-        global GAME_STATE 
-        GAME_STATE = ""  # Reset game state for the new round
+        self.events.clear()  # Reset game state for the new round
         players_str = ', '.join([f"{player}({player.rr_played})" for player in players])
-        update_game_state(f"Playing round {self.round_number} with {len(players)} players. Player order will be: {players_str}")
-        update_game_state("The number next to each player is the number of times they have played Russian Roulette (RR) so far.")
+        self.update_game_state(f"Playing round {self.round_number} with {len(players)} players. Player order will be: {players_str}")
+        self.update_game_state("The number next to each player is the number of times they have played Russian Roulette (RR) so far.")
 
         # Shuffle the cards
         self.shuffle_cards()
@@ -504,14 +804,12 @@ class GameProg(BaseGame):
         log_message(msg)
 
         # Determine the table card
-        self.table_card = random.choice(['Q', 'K', 'A'])
+        self.table_card = self.rng.choice(['Q', 'K', 'A'])
         msg = f"The table card is: {self.table_card}"
-        update_game_state(msg)
+        self.update_game_state(msg)
+        self.events.pin()  # the round header is kept however long the round gets
 
-        if Language == "a":
-            msg = f"Starting round {self.round_number} with table card {self.table_card}"
-        else:
-            msg = f"开始第{self.round_number}轮"
+        msg = announcement(StartingRound, round=self.round_number, table_card=self.table_card)
         self.show_message(msg)
         
         # Play until a challenge is issued
@@ -521,24 +819,18 @@ class GameProg(BaseGame):
         while True:
             player = players[start]
             player.in_play = True
-            if Language == "a":
-                msg = f"{player}'s turn..."
-            else:
-                msg = f"轮到{player}出牌了..."
+            msg = announcement(PlayerTurn, player=player)
             self.show_message(msg)
             log_message(msg)
 
-            cards_played, taunt = player.play_card(last_player, self.table_card)
+            cards_played, taunt = self.take_turn(player, last_player)
             self.update_screen()
             if taunt != "":
                 self.voice_say(player.voice, taunt, speed=1.0)
             if len(cards_played) == 0 : # challenge issued
                 assert last_player is not None, "Challenge issued without a last player."
-                if Language == "a":
-                    msg = f"{player} challenges {last_player}!"
-                else:
-                    msg = f"{player} 挑战 {last_player}!"
-                update_game_state(msg)
+                msg = announcement(Challenges, player=player, last_player=last_player)
+                self.update_game_state(msg, kind="challenge")
                 self.show_message(msg, msg_type="challenge")
 
                 if self.check_cards(last_played_cards):
@@ -546,7 +838,8 @@ class GameProg(BaseGame):
                 else:
                     rr_shooter = last_player
 
-                self.russian_roulette(rr_shooter)
+                if self.russian_roulette(rr_shooter):
+                    killed = rr_shooter
                 
                 player.in_play = False
 
@@ -556,7 +849,8 @@ class GameProg(BaseGame):
                 msg = f"{player} has played {len(cards_played)} card" + ("s." if len(cards_played) > 1 else ".") 
             else:
                 msg = f"{player} 出了 {len(cards_played)} 张牌"
-            update_game_state(msg)
+            self.update_game_state(msg, kind="play")
+            self.prefetch_turn(players[(start + 1) % number_of_all_players], player)
             self.show_message(msg, msg_type="play", voice=False)
 
             player.in_play = False
@@ -593,9 +887,11 @@ keep playing cards in their respective order, which should loop if needed. Keep
 track of who is alive and who is dead. After a challenge is issued and a player 
 has played RR, start a new round by again, first determining the player order 
 using the 'round_order' tool. Determine if there is a winner, if not, then 
-continue the game by calling  the 'start_round' tool. You will not play the game 
-yourself. All prompts should be done only through the tools provided. You may 
-taunt all the players in the game as an announcer to keep the game lively. The 
+continue the game by calling  the 'start_round' tool. You may call several tools 
+in one response when a call does not need the result of the calls before it, 
+e.g. 'prompt_russian_roulette' and then 'prompt_round_order'. They are run in 
+the order given. You will not play the game yourself. All prompts should be 
+done only through the tools provided. You may taunt all the players in the game as an announcer to keep the game lively. The 
 message must be in {lang}. When doing so, return only a message with "COMMENT: 
 <your taunt message in {lang}>", which will be broadcast to all players. In the 
 message, refer to play 0 as {player0}, player 1 as {player1}, player 2 as 
@@ -603,12 +899,14 @@ message, refer to play 0 as {player0}, player 1 as {player1}, player 2 as
 """
 
 class GameAgent(BaseGame):
-    def __init__(self, players, show_context=None, agent_model="google/gemini-2.5-flash"):
-        super().__init__(players, show_context=show_context)
+    def __init__(self, players, show_context=None, agent_model="google/gemini-2.5-flash", seed=None):
+        super().__init__(players, show_context=show_context, seed=seed)
         self.agent_mode = True
         
-        self.agent = BLMPClient(model=agent_model)
-        self.agent_messages = []
+        self.agent = BLMPClient(model=agent_model, retry=DEALER_RETRY)
+        self.context = None
+        self.last_tool = None  # (name, arguments, result) of the last tool the dealer called
+        self.last_turn = None  # arguments of the last prompt_player_turn
 
         self.dead_players = []
         self.tools = [
@@ -730,23 +1028,20 @@ class GameAgent(BaseGame):
 
         players = [self.all_players[i] for i in players]
 
-        global GAME_STATE 
-        GAME_STATE = ""  # Reset game state for the new round
+        self.events.clear()  # Reset game state for the new round
         players_str = ', '.join([f"{player}({player.rr_played})" for player in players])
-        update_game_state(f"Playing round {self.round_number} with {len(players)} players. Player order will be: {players_str}")
-        update_game_state("The number next to each player is the number of times they have played Russian Roulette (RR) so far.")
+        self.update_game_state(f"Playing round {self.round_number} with {len(players)} players. Player order will be: {players_str}")
+        self.update_game_state("The number next to each player is the number of times they have played Russian Roulette (RR) so far.")
         
         log_message("AGENT SHUFFLING CARDS")
         self.shuffle_cards()
 
-        self.table_card = random.choice(['Q', 'K', 'A'])
+        self.table_card = self.rng.choice(['Q', 'K', 'A'])
         msg = f"The table card is: {self.table_card}"
-        update_game_state(msg)
+        self.update_game_state(msg)
+        self.events.pin()  # the round header is kept however long the round gets
 
-        if Language == "a":
-            msg = f"Starting round {self.round_number} with table card {self.table_card}" 
-        else:
-            msg = f"开始第{self.round_number}轮"
+        msg = announcement(StartingRound, round=self.round_number, table_card=self.table_card)
         self.show_message(msg)
 
     def prompt_check_cards(self, cards):
@@ -758,30 +1053,28 @@ class GameAgent(BaseGame):
         last_player = self.all_players[last_player_index] if last_player_index is not None else None
         log_message(f"AGENT PROMPTING {player} TURN, LAST PLAYER: {last_player}")
         player.in_play = True
-        if Language == "a":
-            msg = f"{player}'s turn..."
-        else:
-            msg = f"轮到{player}出牌了..."
+        msg = announcement(PlayerTurn, player=player)
         self.show_message(msg)
         log_message(msg)
-        cards_played, taunt = player.play_card(last_player, self.table_card)
+        cards_played, taunt = self.take_turn(player, last_player)
         self.update_screen()
         if taunt != "":
             self.voice_say(player.voice, taunt, speed=1.0)
         if len(cards_played) == 0 : # challenge issued
             assert last_player is not None, "Challenge issued without a last player."
-            if Language == "a":
-                msg = f"{player} challenges {last_player}!"
-            else:
-                msg = f"{player} 挑战 {last_player}!"
-            update_game_state(msg)
+            msg = announcement(Challenges, player=player, last_player=last_player)
+            self.update_game_state(msg, kind="challenge")
             self.show_message(msg, msg_type="challenge")
         else:
             if Language == "a":
                 msg = f"{player} has played {len(cards_played)} card" + ("s." if len(cards_played) > 1 else ".") 
             else:
                 msg = f"{player} 出了 {len(cards_played)} 张牌"
-            update_game_state(msg)
+            self.update_game_state(msg, kind="play")
+            # The dealer should call the next seated player, so start on their move already
+            if player in self.players_in_round:
+                seat = self.players_in_round.index(player)
+                self.prefetch_turn(self.players_in_round[(seat + 1) % len(self.players_in_round)], player)
             self.show_message(msg, msg_type="play", voice=False)
 
         player.in_play = False
@@ -795,6 +1088,108 @@ class GameAgent(BaseGame):
         else:
             return f"{player.name} (player {player_index}) has survived the RR!"
 
+    def expected_action(self):
+        """
+        The tool call the rules require next, as (name, arguments), or None once the game is over.
+        """
+        if self.last_tool is None:
+            return "start_game", {}
+        name, args, result = self.last_tool
+        if name == "start_game" or name == "prompt_russian_roulette":
+            return "prompt_round_order", {}
+        if name == "prompt_round_order":
+            return ("start_round", {"players": result}) if len(result) > 1 else None
+        order = [self.all_players.index(p) for p in self.players_in_round]
+        if name == "start_round":
+            return "prompt_player_turn", {"player_index": order[0], "last_player_index": None}
+        if name == "prompt_player_turn":
+            player = args["player_index"]
+            if result:
+                following = order[(order.index(player) + 1) % len(order)] if player in order else order[0]
+                return "prompt_player_turn", {"player_index": following, "last_player_index": player}
+            return "prompt_check_cards", {"cards": self.all_players[args["last_player_index"]].last_played_cards}
+        if name == "prompt_check_cards":
+            loser = self.last_turn["player_index"] if result else self.last_turn["last_player_index"]
+            return "prompt_russian_roulette", {"player_index": loser}
+        return "prompt_round_order", {}
+
+    def dealer_summary(self):
+        """
+        Compact state of the game, sent to the dealer once older exchanges are dropped.
+        """
+        alive = [f"{i} {p.name} (RR {p.rr_played})" for i, p in enumerate(self.all_players) if p.alive]
+        dead = [f"{i} {p.name}" for i, p in enumerate(self.all_players) if not p.alive]
+        started = " (the game has already been started, do not call 'start_game' again)" if self.state == "running" else ""
+        lines = [f"Game state{started}:",
+                 f"Alive players: {', '.join(alive)}.",
+                 f"Dead players: {', '.join(dead) if dead else 'none'}."]
+        if self.round_number > 0:
+            lines.append(f"Round {self.round_number}, table card {self.table_card}, "
+                         f"round order: {[self.all_players.index(p) for p in self.players_in_round]}.")
+        if self.last_turn is not None:
+            player = self.last_turn["player_index"]
+            played = self.last_tool[2] if self.last_tool[0] == "prompt_player_turn" else None
+            lines.append(f"Last turn: player {player} " + (f"played {len(played)} cards." if played else "challenged."))
+        action = self.expected_action()
+        if action is None:
+            lines.append("Next: the game is over.")
+        else:
+            name, args = action
+            lines.append(f"Next: call '{name}' with {json.dumps(args)}.")
+        return "\n".join(lines)
+
+    def run_tool_calls(self, response):
+        """
+        Run every tool call of a dealer response, one after another in the given order,
+        on this thread. Returns (tool call, tool name, result) for each.
+        """
+        calls = []
+        for tool_call in response.tool_calls:
+            tool_name = tool_call.function.name
+            if tool_name not in self.TOOL_MAPPING:
+                print(response)
+                raise Exception(f"Tool {tool_name} not found in TOOL_MAPPING")
+            if self.agent.api_type == APIType.OPENROUTER:
+                with phase("parse"):
+                    tool_args = json.loads(tool_call.function.arguments or "{}")
+            elif self.agent.api_type == APIType.OLLAMA:
+                tool_args = tool_call.function.arguments
+            calls.append((tool_call, tool_name, tool_args))
+
+        results = []
+        for tool_call, tool_name, tool_args in calls:
+            tool_response = self.TOOL_MAPPING[tool_name](**tool_args)
+            self.record_tool(tool_name, tool_args, tool_response)
+            results.append((tool_call, tool_name, tool_response))
+        return results
+
+    def record_tool(self, tool_name, tool_args, tool_response, local=False):
+        """
+        Log a finished tool call and keep track of where the game is, see expected_action.
+        """
+        log_event("tool_call", name=tool_name, arguments=tool_args, result=tool_response, local=local)
+        self.last_tool = (tool_name, tool_args, tool_response)
+        if tool_name == "prompt_player_turn":
+            self.last_turn = tool_args
+        elif tool_name == "start_round":
+            self.last_turn = None
+
+    def announce_comment(self, comment):
+        self.update_game_state(f"Announcer Taunt: {comment}", kind="taunt")
+        self.wait_say()
+        #self.voice_say(Announcer_voice, comment, speed=1.0)
+        self.show_message(comment)
+
+    def dealer_call(self):
+        start = time.perf_counter()
+        with phase("prompt_build"):
+            messages = self.context.messages()
+        with tagged(role="dealer", round=self.round_number):
+            response = self.agent.f_call(messages, tools=self.tools)
+        log_event("llm_call", role="dealer", model=str(self.agent), messages=len(messages), tokens=self.context.last_tokens,
+                  seconds=round(time.perf_counter() - start, 4))
+        return response
+
     def play(self):
         log_message("Playing the game...")
 
@@ -805,96 +1200,220 @@ class GameAgent(BaseGame):
             player3=self.all_players[3].name,
             lang = LangName
         )
-        self.agent_messages = [
-            system_message(agent_prompt),
-            user_message(f"Play a game of BluffMind with {len(self.all_players)} players.")
-        ]
-        response = self.agent.f_call(self.agent_messages, tools=self.tools)
+        self.context = DealerContext(agent_prompt, f"Play a game of BluffMind with {len(self.all_players)} players.",
+                                     summary=self.dealer_summary, window=DEALER_WINDOW, max_tokens=DEALER_MAX_TOKENS)
+        response = self.dealer_call()
 
         while True:
-            self.agent_messages.append(response.model_dump())
+            self.context.add_response(response.model_dump(exclude_none=True))
 
             if "GAME OVER" in response.content:
                 print(f"LLM returned: {response.content}")
                 break
             if "COMMENT:" in response.content:
-                comment = response.content.replace("COMMENT:", "", 1).strip()
-                update_game_state(f"Announcer Taunt: {comment}")
-                self.wait_say()
-                #self.voice_say(Announcer_voice, comment, speed=1.0)
-                self.show_message(comment)
-            if response.tool_calls is not None:
-                tool_call = response.tool_calls[0]
-                tool_name = tool_call.function.name
-                if self.agent.api_type == APIType.OPENROUTER:
-                    tool_args = json.loads(tool_call.function.arguments)
-                elif self.agent.api_type == APIType.OLLAMA:
-                    tool_args = tool_call.function.arguments
-
-                if tool_name in self.TOOL_MAPPING:
-                    tool_response = self.TOOL_MAPPING[tool_name](**tool_args)
-                    if type(tool_response) is str and "killed" in tool_response:
-                        self.agent_messages = [
-                            system_message(agent_prompt),
-                            user_message(f"Continue the game of BluffMind with {len(self.all_players)} players. Account for the fact that players {self.dead_players} have been killed. The game has already been started, do not call the 'start_game' tool again.")
-                        ]
-                    else:
-                        self.agent_messages.append({
-                            "role": "tool",
-                            "tool_call_id": tool_call.id,
-                            "name": tool_name,
-                            "content": json.dumps(tool_response)
-                        })
-                else:
-                    print(response)
-                    raise Exception(f"Tool {tool_name} not found in TOOL_MAPPING")
-            response = self.agent.f_call(self.agent_messages, tools=self.tools)
+                self.announce_comment(response.content.replace("COMMENT:", "", 1).strip())
+            if response.tool_calls:
+                for tool_call, tool_name, tool_response in self.run_tool_calls(response):
+                    self.context.add_tool_result({
+                        "role": "tool",
+                        "tool_call_id": tool_call.id,
+                        "name": tool_name,
+                        "content": json.dumps(tool_response)
+                    })
+            response = self.dealer_call()
+        self.state = "finished"
+
+COMMENT_PROMPT = """
+You are the announcer of a game of BluffMind, a bluffing card game with Russian 
+Roulette, between {players}. Given what happened in the round so far, reply with 
+one short taunt for the players in {lang}, to keep the game lively. Reply with 
+the taunt only.
+"""
+
+class GameHybrid(GameAgent):
+    '''
+    Agent mode where the dealer steps that the rules determine, which are all of
+    them (see GameAgent.expected_action), run locally without a round trip to
+    the agent. The agent is only asked for the announcer's comments, in the
+    background after every Russian Roulette, and a comment is shown at the first
+    step after it arrives. Dealer calls saved are counted in result().
+    '''
+    def __init__(self, players, show_context=None, agent_model="google/gemini-2.5-flash", seed=None):
+        super().__init__(players, show_context=show_context, agent_model=agent_model, seed=seed)
+        self.local_steps = 0
+        self.comment_calls = 0
+        self._comment_executor = None
+        self._comment = None  # future of the pending comment request
+
+    def comment_call(self, messages):
+        start = time.perf_counter()
+        with tagged(role="dealer", round=self.round_number):
+            code, content = self.agent.complete_chat(messages, deadline=time.monotonic() + TURN_DEADLINE)
+        log_event("llm_call", role="dealer", model=str(self.agent), messages=len(messages), code=code,
+                  seconds=round(time.perf_counter() - start, 4))
+        return code, content
+
+    def request_comment(self):
+        if self._comment is not None:
+            return  # still waiting for the last one
+        messages = [
+            system_message(COMMENT_PROMPT.format(players=", ".join(p.name for p in self.all_players), lang=LangName)),
+            user_message(self.events.render())
+        ]
+        self.comment_calls += 1
+        self._comment = self._comment_executor.submit(self.comment_call, messages)
+
+    def show_comment(self):
+        if self._comment is None or not self._comment.done():
+            return
+        code, content = self._comment.result()
+        self._comment = None
+        if code != 0:
+            log_message(f"Dealer comment failed: {content}")
+        elif content.strip():
+            self.announce_comment(content.replace("COMMENT:", "", 1).strip())
+
+    def saved_calls(self):
+        """
+        Dealer calls saved: one per local step, plus the one announcing the winner, less the comment calls.
+        """
+        return self.local_steps + 1 - self.comment_calls
+
+    def play(self):
+        log_message("Playing the game with the hybrid dealer...")
+        self._comment_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="comment")
+        try:
+            while (action := self.expected_action()) is not None:
+                tool_name, tool_args = action
+                tool_response = self.TOOL_MAPPING[tool_name](**tool_args)
+                self.record_tool(tool_name, tool_args, tool_response, local=True)
+                self.local_steps += 1
+                if tool_name == "prompt_russian_roulette":
+                    self.request_comment()
+                self.show_comment()
+        finally:
+            self._comment_executor.shutdown(wait=False, cancel_futures=True)  # a late comment is not worth waiting for
+        winners = [p.name for p in self.all_players if p.alive]
+        log_message(f"GAME OVER: {winners[0] if winners else 'Nobody'} won!")
+        log_message(f"Hybrid dealer: {self.local_steps} steps run locally, {self.comment_calls} comment calls, "
+                    f"{self.saved_calls()} dealer calls saved")
         self.state = "finished"
 
+    def result(self):
+        result = super().result()
+        result["dealer_calls_saved"] = self.saved_calls()
+        result["dealer_comment_calls"] = self.comment_calls
+        return result
+
+def load_config(config_file):
+    """
+    Load a player configuration file and set the game language from it.
+    Returns the parsed configuration.
+    """
+    global Language, LangName, Announcer_voice, ODDS_HINT, STRATEGY_FILE, TURN_DEADLINE, INVALID_MOVE_RETRIES, FALLBACK_MODEL
+    global DEALER_RETRY, DEALER_WINDOW, DEALER_MAX_TOKENS, MAX_HISTORY_EVENTS
+    with open(config_file, 'r') as f:
+        data = json.load(f)
+    Language = data.get("language", "a")
+    MAX_HISTORY_EVENTS = data.get("max_history_events", None)
+    ODDS_HINT = data.get("odds_hint", True)
+    STRATEGY_FILE = data.get("strategy_file", "strategy.bin")
+    TURN_DEADLINE = data.get("turn_deadline", 60)
+    INVALID_MOVE_RETRIES = data.get("invalid_move_retries", 2)
+    FALLBACK_MODEL = data.get("fallback_model", "Odds")
+    if FALLBACK_MODEL not in BOT_MODELS:
+        raise ValueError(f"Invalid fallback model: {FALLBACK_MODEL}. Supported models are: {', '.join(BOT_MODELS)}.")
+    if "retry" in data:
+        set_retry_policy(RetryPolicy(**data["retry"]))
+    if "dealer_retry" in data:
+        DEALER_RETRY = RetryPolicy(**data["dealer_retry"])
+    DEALER_WINDOW = data.get("dealer_window", 16)
+    DEALER_MAX_TOKENS = data.get("dealer_max_tokens", 4000)
+    if "prices" in data:
+        set_prices(data["prices"])
+    if "rate_limits" in data:
+        set_rate_limiter(RateLimiter(data["rate_limits"], data.get("rate_limit_dir")))
+    if Language == "a":
+        LangName = "English"
+        Announcer_voice = "am_eric"  
+    else:
+        LangName = "Chinese"
+        Announcer_voice = "zm_yunyang"  
+    return data
+
+def warmup_models(players):
+    """
+    Load the players' local models on background threads while the game starts.
+    """
+    models = {}
+    for player in players:
+        if isinstance(player.model, BLMPClient) and player.model.api_type == APIType.OLLAMA:
+            models.setdefault((player.model.base_url, player.model.model), player.model)
+    for client in models.values():
+        threading.Thread(target=client.warmup, name=f"warmup-{client}", daemon=True).start()
+
+def make_players(data):
+    """
+    Create a fresh list of players from a loaded configuration.
+    """
+    players = []
+    for player_data in data.get("players", []):
+        name = player_data.get("name", "Unknown")
+        model = player_data.get("model", "Random")
+        api = player_data.get("api", "openrouter")
+        if api.lower() not in [APIType.OPENROUTER.value, APIType.OLLAMA.value]:
+            raise TypeError(f"Invalid API type: {api}. Supported types are: {APIType.OPENROUTER.value}, {APIType.OLLAMA.value}.")
+        if model == "Strategy" or (model not in BOT_MODELS and FALLBACK_MODEL == "Strategy"):
+            from strategy import load_table
+            load_table(STRATEGY_FILE) # fail now if the table is missing
+        if model not in BOT_MODELS:
+            model = BLMPClient(model=model, api_type=APIType(api.lower()), base_url=player_data.get("base_url"))
+        persona = player_data.get("persona", "")
+        voice = player_data.get("voice", "am_echo")
+        aggro = player_data.get("aggro", 50)
+        players.append(Player(name, model, persona, voice, aggro))
+    return players
+
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(description="BluffMind")
     parser.add_argument('-b', '--batch', action='store_true', help='Enable batch mode (no dashboard, no voice acting)')
     parser.add_argument('-d', '--disable_agent', action='store_true', help='Disable the agent mode and run the game in normal program mode')
+    parser.add_argument('--hybrid', action='store_true', help='Run the dealer steps locally and only ask the agent for comments, in the background')
     parser.add_argument('-l', '--logfile', type=str, default='bluff_mind.log', help='Log file name')
+    parser.add_argument('--log_format', type=str, default='text', choices=['text', 'jsonl'], help='Plain text log, or typed JSONL events written in the background')
+    parser.add_argument('--log_max_bytes', type=int, default=None, help='Rotate a JSONL log when it reaches this size')
     parser.add_argument('-c', '--config', type=str, default='config.json', help='Configuration file for players')
+    parser.add_argument('--audio', type=str, default='stream', choices=['stream', 'playsound', 'file', 'null'], help='Audio output in show mode')
+    parser.add_argument('--voice_cache', type=str, default=None, help='Keep synthesized voice lines in this directory across runs')
+    parser.add_argument('--cache', type=str, default=None, help='Cache LLM responses in this file')
+    parser.add_argument('--cache_mode', type=str, default='readwrite', choices=['readwrite', 'readonly', 'replay'], help='Response cache mode')
+    parser.add_argument('-s', '--seed', type=int, default=None, help='Game seed (default: random)')
+    parser.add_argument('--record', type=str, default=None, help='Write the game record for replay.py to this file')
+    parser.add_argument('--metrics', type=str, default=None, help='Write LLM and TTS metrics in Prometheus text format to this file')
+    parser.add_argument('--profile', type=str, default=None, help='Time the game phases and write their collapsed stacks, for flamegraph tools, to this file')
     args = parser.parse_args()
 
-    config = args.config
-    players = []
+    Audio_sink = args.audio
+    Voice_cache = args.voice_cache
+    METRICS_FILE = args.metrics
+    PROFILE_FILE = args.profile
+    if args.profile:
+        PROFILER.start()
+
+    if args.cache:
+        from cache import ResponseCache
+        set_response_cache(ResponseCache(args.cache, mode=args.cache_mode))
 
-    if config:
-        config_file = config
-    else:
-        config_file = "config.json"
     try:
-        with open(config_file, 'r') as f:
-            data = json.load(f)
-            Language = data.get("language", "a")
-            for player_data in data.get("players", []):
-                name = player_data.get("name", "Unknown")
-                model = player_data.get("model", "Random")
-                api = player_data.get("api", "openrouter")
-                if api.lower() not in [APIType.OPENROUTER.value, APIType.OLLAMA.value]:
-                    raise TypeError(f"Invalid API type: {api}. Supported types are: {APIType.OPENROUTER.value}, {APIType.OLLAMA.value}.")
-                if model != "Random":
-                    model = BLMPClient(model=model, api_type=APIType(api.lower()))
-                persona = player_data.get("persona", "")
-                voice = player_data.get("voice", "am_echo")
-                aggro = player_data.get("aggro", 50)
-                players.append(Player(name, model, persona, voice, aggro))
+        with phase("startup"):
+            players = make_players(load_config(args.config or "config.json"))
     except Exception as e:
-        print(f"Error loading configuration file {config_file}: {e}")
+        print(f"Error loading configuration file {args.config}: {e}")
         exit(1)
 
-    if Language == "a":
-        LangName = "English"
-        Announcer_voice = "am_eric"  
-    else:
-        LangName = "Chinese"
-        Announcer_voice = "zm_yunyang"  
-
-    log_start(args.logfile, args.batch)
+    warmup_models(players)
+    log_start(args.logfile, args.batch, structured=(args.log_format == 'jsonl'), max_bytes=args.log_max_bytes)
 
     if args.batch is False:
         from display import get_show_context
@@ -905,18 +1424,25 @@ if __name__ == "__main__":
 
     if args.disable_agent:
         log_message("Running in normal mode...")
-        game = GameProg(players, show_context=show_context) 
+        game = GameProg(players, show_context=show_context, seed=args.seed)
+    elif args.hybrid:
+        log_message("Running in hybrid agent mode...")
+        game = GameHybrid(players, show_context=show_context, seed=args.seed)
     else:
         log_message("Running in agent mode...")
-        game = GameAgent(players, show_context=show_context)
+        game = GameAgent(players, show_context=show_context, seed=args.seed)
         
     # Use the __enter__, try, finally, __exit__ pattern instead of 'with' statement so that
     # the SHOW mode and BATCH mode can use the same code. 
     try:
         game.play()
         game.report()
+        if args.record:
+            with open(args.record, "w") as f:
+                f.write(json.dumps(game.result(), ensure_ascii=False) + "\n")
     finally:
         if show_context is not None:
             show_context.__exit__(None, None, None)
+        game.close()
 
     log_end()
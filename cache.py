@@ -0,0 +1,126 @@
+# Copyright (c) 2025 Kevin Lin
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+'''
+Disk-backed LRU cache for LLM responses.
+Requests are normalized (keys sorted, empty fields dropped) and hashed, so the same
+(model, messages, response_format) payload always maps to the same entry. Entries
+live in a SQLite file bounded in size, evicting the least recently used first, with
+a small in-memory LRU in front so repeated hits never touch the disk.
+
+Modes:
+- "readwrite": hits are served from the cache, misses are stored.
+- "readonly": hits are served from the cache, misses go to the API and are not stored.
+- "replay": hits are served from the cache, misses raise CacheMiss, so no request
+  ever leaves the process.
+'''
+
+CACHE_MODES = ["readwrite", "readonly", "replay"]
+
+class CacheMiss(Exception):
+    pass
+
+def _normalize(obj):
+    if hasattr(obj, "model_dump"):
+        obj = obj.model_dump()
+    if isinstance(obj, dict):
+        return {k: _normalize(v) for k, v in obj.items() if v is not None and v != [] and v != {}}
+    if isinstance(obj, (list, tuple)):
+        return [_normalize(v) for v in obj]
+    return obj
+
+class ResponseCache:
+    def __init__(self, path="bluff_mind_cache.sqlite", max_bytes=256 * 1024 * 1024, mode="readwrite", memory_entries=1024):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Invalid cache mode: {mode}. Supported modes are: {', '.join(CACHE_MODES)}.")
+        self.path = path
+        self.max_bytes = max_bytes
+        self.mode = mode
+        self.memory_entries = memory_entries
+        self.hits = 0
+        self.misses = 0
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT, size INTEGER, last_used REAL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        self._size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    @staticmethod
+    def key(*parts):
+        """
+        Hash the normalized request parts into a cache key.
+        """
+        payload = json.dumps(_normalize(list(parts)), sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """
+        Return the cached value for key, or None on a miss (CacheMiss in replay mode).
+        """
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+            row = self._db.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                if self.mode == "replay":
+                    raise CacheMiss(f"No cached response for request {key} in replay mode.")
+                return None
+            if self.mode == "readwrite":
+                self._db.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+            value = json.loads(row[0])
+            self._remember(key, value)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self.mode != "readwrite":
+            return
+        data = json.dumps(value, ensure_ascii=False)
+        size = len(data.encode("utf-8"))
+        with self._lock:
+            self._remember(key, value)
+            old = self._db.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            if old is not None:
+                self._size -= old[0]
+            self._db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)", (key, data, size, time.time()))
+            self._size += size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict(self):
+        # Drop the least recently used entries until the store is back under 90% of its bound
+        target = self.max_bytes * 0.9
+        for key, size in self._db.execute("SELECT key, size FROM entries ORDER BY last_used").fetchall():
+            if self._size <= target:
+                break
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._memory.pop(key, None)
+            self._size -= size
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __str__(self):
+        return f"{self.path} ({self.mode}, {self.hits} hits, {self.misses} misses)"
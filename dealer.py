@@ -0,0 +1,72 @@
+# Copyright (c) 2025 Kevin Lin
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+from collections import deque
+
+from blmp import system_message, user_message
+from ratelimit import message_tokens
+
+'''
+Context of the dealer agent.
+Instead of resending the whole conversation on every step, the dealer is sent
+the system prompt, the request to play, and a sliding window of the most recent
+exchanges: an assistant message together with the results of its tool calls,
+which are never split. Exchanges leave the window when there are more than
+window of them, or when the messages would exceed max_tokens (estimated as in
+ratelimit.py), so every dealer call costs about the same however long the game
+runs. Once anything has been dropped, a state summary generated by the game
+(alive players, round, table card, last play, the expected next action) is
+sent along with the request, so the dealer can go on from it.
+'''
+
+DEFAULT_WINDOW = 16 # exchanges, more than a typical round
+DEFAULT_MAX_TOKENS = 4000
+
+class DealerContext:
+    def __init__(self, system_prompt, request, summary=None, window=DEFAULT_WINDOW, max_tokens=DEFAULT_MAX_TOKENS):
+        self.head = [system_message(system_prompt)]
+        self.request = request
+        self.summary = summary # callable returning the state summary text
+        self.window = window
+        self.max_tokens = max_tokens
+        self.exchanges = deque() # (messages, tokens)
+        self.dropped = 0 # exchanges no longer sent
+        self.last_tokens = 0
+        self._head_tokens = sum(message_tokens(m) for m in self.head)
+
+    def add_response(self, message):
+        """
+        Start a new exchange with an assistant message, a dict.
+        """
+        self.exchanges.append(([message], message_tokens(message)))
+
+    def add_tool_result(self, message):
+        messages, tokens = self.exchanges[-1]
+        messages.append(message)
+        self.exchanges[-1] = (messages, tokens + message_tokens(message))
+
+    def _request_message(self):
+        if self.dropped and self.summary is not None:
+            return user_message(f"{self.request}\n\n{self.summary()}")
+        return user_message(self.request)
+
+    def messages(self):
+        """
+        The messages for the next dealer call. Their estimated size is kept in last_tokens.
+        """
+        while len(self.exchanges) > self.window:
+            self.exchanges.popleft()
+            self.dropped += 1
+        while True:
+            request = self._request_message()
+            self.last_tokens = self._head_tokens + message_tokens(request) + sum(t for _, t in self.exchanges)
+            if self.last_tokens <= self.max_tokens or len(self.exchanges) <= 1:
+                break
+            self.exchanges.popleft()
+            self.dropped += 1
+        return self.head + [request] + [m for messages, _ in self.exchanges for m in messages]
+
+    def __len__(self):
+        return len(self.exchanges)
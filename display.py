@@ -3,11 +3,15 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+import time
+import threading
 from rich.layout import Layout
 from rich.panel import Panel
 from rich.table import Table
 from rich.live import Live
-    
+
+from profiler import phase
+
 BluffMind = ["Bluff Mind", "神仙吹牛牌"]
 AgentMode = ["Agent Mode", "代理模式"]
 ProgMode = ["Prog Mode", "程序模式"]
@@ -21,15 +25,14 @@ RRPlayed = ["RR Played", "已打枪数"]
 CardsLeft = ["Cards Left", "剩余牌"]
 LastPlayed = ["Last Played", "上次出牌"]
 ToChallengeOrNot = ["To Challenge or Not, That's the Question", "挑战还是不挑战，这就是问题"]
-KilledInRound = ["Killed In Round", "挂掉轮次:"]   
+KilledInRound = ["Killed In Round", "挂掉轮次:"]
 
-def make_screen(game=None, agent_mode=False, lang="a") -> Layout:
-    if lang == "a":
-        lang = 0
-    else:
-        lang = 1
-        
-    """Create the screen layout."""
+FooterStyles = {"challenge": "yellow", "rr": "magenta", "killed": "red", "survived": "green", "play": "blue"}
+
+def _lang_index(lang):
+    return 0 if lang == "a" else 1
+
+def _make_layout():
     layout = Layout()
     layout.split(
         Layout(name="header", size=3),
@@ -42,8 +45,9 @@ def make_screen(game=None, agent_mode=False, lang="a") -> Layout:
     )
     layout["left"].split(Layout(name="box1"), Layout(name="box4"))
     layout["right"].split(Layout(name="box2"), Layout(name="box3"))
+    return layout
 
-    # Header
+def _header_panel(game, agent_mode, lang):
     grid = Table.grid(expand=True)
     grid.add_column(justify="center", ratio=1)
     grid.add_column(justify="right")
@@ -57,70 +61,143 @@ def make_screen(game=None, agent_mode=False, lang="a") -> Layout:
             f"[b]{BluffMind[lang]}[/b] " + (f"({AgentMode[lang]})" if agent_mode else f"({ProgMode[lang]})"),
             f"{NotStartedYet[lang]}"
         )
-    layout["header"].update(Panel(grid, style="white on blue"))
-    
+    return Panel(grid, style="white on blue")
+
+def _player_panel(player, lang):
+    if player.in_play:
+        style = "green"
+    else:
+        style = "blue"
+    return Panel(
+        f"{player.model}" + "\n\n"
+        f"{AggLevel[lang]} : {player.aggro}" +
+        "\n" +
+        f"{RRPosition[lang]} : {player.rr_position}  {RRPlayed[lang]} : {player.rr_played}\n" +
+        "\n" +
+        f"{CardsLeft[lang]}  : {', '.join(player.cards)}\n" +
+        f"{LastPlayed[lang]} : {', '.join(player.last_played_cards)}\n" +
+        "\n" +
+        f"{player.mind}\n" +
+        "\n" +
+        f"\"{player.taunt}\"",
+        title=f"{player.name}",
+        style=style
+    )
+
+def _dead_panel(player, lang):
+    return Panel(
+        f"{player.model}" + "\n\n"
+        "\n\n" +
+        f"{KilledInRound[lang]} {player.dead_round}",
+        title=f"{player.name}",
+        style="red"
+    )
+
+def _footer_panel(game, lang):
+    return Panel(game.screen_message,
+                 title=f"{ToChallengeOrNot[lang]}",
+                 style=FooterStyles.get(game.screen_message_type, "black"))
+
+def _panels(game, agent_mode, lang):
+    """
+    Yield (layout name, state key, panel factory) for every part of the screen.
+    The key captures everything the panel shows, so equal keys mean equal panels.
+    """
     if game is None:
-        layout["box1"].update(Panel("", title=""))
-        layout["box2"].update(Panel("", title=""))
-        layout["box3"].update(Panel("", title=""))
-        layout["box4"].update(Panel("", title=""))
-        layout["footer"].update(Panel(f"{Initializing[lang]} ...", title=""))
-        return layout
+        yield "header", None, lambda: _header_panel(None, agent_mode, lang)
+        for i in range(4):
+            yield f"box{i+1}", None, lambda: Panel("", title="")
+        yield "footer", None, lambda: Panel(f"{Initializing[lang]} ...", title="")
+        return
 
+    yield "header", (game.round_number, game.table_card), lambda: _header_panel(game, agent_mode, lang)
     i = 0
     for player in game.players_in_round:
-        if player.in_play:
-            style = "green"
-        else:
-            style = "blue"
-        layout[f"box{i+1}"].update(Panel(
-            f"{player.model}" + "\n\n"
-            f"{AggLevel[lang]} : {player.aggro}" +
-            "\n" +
-            f"{RRPosition[lang]} : {player.rr_position}  {RRPlayed[lang]} : {player.rr_played}\n" + 
-            "\n" +
-            f"{CardsLeft[lang]}  : {', '.join(player.cards)}\n" + 
-            f"{LastPlayed[lang]} : {', '.join(player.last_played_cards)}\n" +
-            "\n" +
-            f"{player.mind}\n" +
-            "\n" +
-            f"\"{player.taunt}\"", 
-            title=f"{player.name}",
-            style=style
-        ))
+        key = (player.name, str(player.model), player.aggro, player.rr_position, player.rr_played,
+               tuple(player.cards), tuple(player.last_played_cards), player.mind, player.taunt, player.in_play)
+        yield f"box{i+1}", key, (lambda p=player: _player_panel(p, lang))
         i += 1
     for player in game.all_players:
         if not player in game.players_in_round:
-            layout[f"box{i+1}"].update(Panel(
-                f"{player.model}" + "\n\n"
-                "\n\n" +
-                f"{KilledInRound[lang]} {player.dead_round}",
-                title=f"{player.name}",
-                style="red"
-            ))
+            key = ("dead", player.name, str(player.model), player.dead_round)
+            yield f"box{i+1}", key, (lambda p=player: _dead_panel(p, lang))
             i += 1
+    yield "footer", (game.screen_message, game.screen_message_type), lambda: _footer_panel(game, lang)
 
-    style = "black"
-    if game.screen_message_type == "challenge":
-        style = "yellow"
-    elif game.screen_message_type == "rr":
-        style = "magenta"
-    elif game.screen_message_type == "killed":
-        style = "red"
-    elif game.screen_message_type == "survived":
-        style = "green"
-    elif game.screen_message_type == "play":
-        style = "blue"
-        
-    layout["footer"].update(Panel(game.screen_message, 
-                                title=f"{ToChallengeOrNot[lang]}", 
-                                style=style))
+def make_screen(game=None, agent_mode=False, lang="a") -> Layout:
+    """Create the screen layout."""
+    lang = _lang_index(lang)
+    layout = _make_layout()
+    for name, _, panel in _panels(game, agent_mode, lang):
+        layout[name].update(panel())
     return layout
 
+class Dashboard:
+    '''
+    Persistent terminal dashboard. It keeps one layout and, on every render, only
+    rebuilds the panels whose player, header or footer state changed. Refreshes
+    are coalesced to at most max_fps per second; the last one is always drawn.
+    '''
+    def __init__(self, agent_mode=False, lang="a", max_fps=10, console=None):
+        from rich.console import Console
+        self.agent_mode = agent_mode
+        self.lang = _lang_index(lang)
+        self.min_interval = 1.0 / max_fps
+        self.layout = _make_layout()
+        self.live = Live(self.layout, console=console or Console(), auto_refresh=False, screen=True)
+        self._keys = {}
+        self._lock = threading.RLock()
+        self._last_refresh = 0.0
+        self._timer = None
+        self.render(None)
+
+    def __enter__(self):
+        self.live.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self.live.refresh()
+        return self.live.__exit__(exc_type, exc_value, traceback)
+
+    def render(self, game):
+        """
+        Bring the screen up to date with the game.
+        """
+        with self._lock:
+            changed = False
+            with phase("make_screen"):
+                for name, key, panel in _panels(game, self.agent_mode, self.lang):
+                    if name not in self._keys or self._keys[name] != key:
+                        self.layout[name].update(panel())
+                        self._keys[name] = key
+                        changed = True
+            if changed:
+                self._request_refresh()
+
+    def _request_refresh(self):
+        wait = self._last_refresh + self.min_interval - time.monotonic()
+        if wait <= 0:
+            self._refresh()
+        elif self._timer is None:
+            self._timer = threading.Timer(wait, self._deferred_refresh)
+            self._timer.name = "screen"
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _deferred_refresh(self):
+        with self._lock:
+            self._timer = None
+            self._refresh()
+
+    def _refresh(self):
+        with phase("screen_draw"):
+            self.live.refresh()
+        self._last_refresh = time.monotonic()
+
 
-def get_show_context(agent_mode, lang="a"):
-    from rich.console import Console
-    from rich.live import Live
-    console = Console()
-    rich_live = Live(make_screen(agent_mode=agent_mode, lang=lang), console=console, auto_refresh=False, screen=True)
-    return rich_live
\ No newline at end of file
+def get_show_context(agent_mode, lang="a", max_fps=10):
+    return Dashboard(agent_mode=agent_mode, lang=lang, max_fps=max_fps)
@@ -0,0 +1,86 @@
+# Copyright (c) 2025 Kevin Lin
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+'''
+Append-only log of public game events.
+Each event is typed (info, play, challenge, rr, taunt) and rendered to one line
+of text once, when it is appended. The rendering of the whole log is cached and
+only extended by the new lines, so building every player's prompt reuses it
+instead of re-copying the history. With max_events set, only the pinned events
+(the round header) and the most recent max_events events are rendered.
+A log is locked while it changes or renders, as a prefetched move (see
+bm.TurnPipeline) renders it on another thread while the game appends to it.
+'''
+
+import threading
+
+EVENT_KINDS = ["info", "play", "challenge", "rr", "taunt"]
+
+class GameEvent:
+    __slots__ = ("kind", "text")
+
+    def __init__(self, kind, text):
+        if kind not in EVENT_KINDS:
+            raise ValueError(f"Invalid event kind: {kind}. Supported kinds are: {', '.join(EVENT_KINDS)}.")
+        self.kind = kind
+        self.text = text
+
+    def __str__(self):
+        return self.text
+
+class EventLog:
+    def __init__(self, max_events=None):
+        self.max_events = max_events
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self.events = []
+            self._lines = []
+            self._pinned = 0
+            self._rendered = ""
+            self._rendered_count = 0
+
+    def append(self, kind, text):
+        event = GameEvent(kind, text)
+        with self._lock:
+            self.events.append(event)
+            self._lines.append(text + "\n")
+
+    def pin(self):
+        """
+        Keep all events so far in every rendering, however long the log gets.
+        """
+        with self._lock:
+            self._pinned = len(self.events)
+
+    def kinds(self, kind):
+        with self._lock:
+            return [e for e in self.events if e.kind == kind]
+
+    def render(self):
+        """
+        Return the log as text, one event per line.
+        """
+        with self._lock:
+            count = len(self._lines)
+            if self.max_events is not None and count - self._pinned > self.max_events:
+                if self._rendered_count != count:
+                    skipped = count - self._pinned - self.max_events
+                    self._rendered = ("".join(self._lines[:self._pinned])
+                                      + f"... ({skipped} earlier events omitted)\n"
+                                      + "".join(self._lines[-self.max_events:]))
+                    self._rendered_count = count
+            elif self._rendered_count != count:
+                self._rendered += "".join(self._lines[self._rendered_count:])
+                self._rendered_count = count
+            return self._rendered
+
+    def __len__(self):
+        return len(self.events)
+
+    def __str__(self):
+        return self.render()
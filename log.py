@@ -3,29 +3,133 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+import os
+import json
+import time
+import queue
+import atexit
+import threading
+
+from profiler import phase
+
+'''
+Game logging.
+By default messages are written as plain text, one per line, and flushed at once.
+In structured mode every entry is a JSON line with a type (message, deal, play,
+challenge, rr, llm_call, tool_call, fallback), written in batches by a background thread
+through a bounded queue, rotated by size, and flushed by log_end. Messages
+echoed to the console are printed by the same thread, so the game never waits
+on the terminal. Nothing is written before log_start.
+'''
+
 global LOGFILE
 
 LOGFILE = None
 PRINT_CONSOLE = False
+STRUCTURED = False
+DEFAULT_LOGFILE = "bluff_mind.log"
+EVENT_TYPES = ["message", "deal", "play", "challenge", "rr", "llm_call", "tool_call", "fallback"]
 
-def log_start(filename, print_console=False):
-    global LOGFILE
-    LOGFILE = open(filename, "w")
-    global PRINT_CONSOLE
+class BufferedWriter:
+    '''
+    Writes lines to a file from a background thread, in batches, printing the
+    console echo of a line if it has one. When max_bytes is set, the file is rotated to filename.1 ... filename.<backups>.
+    '''
+    def __init__(self, filename, max_bytes=None, backups=3, queue_size=10000, batch_size=256):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.file = open(filename, "w", encoding="utf-8")
+        self.size = 0
+        self.thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self.thread.start()
+
+    def write(self, line, echo=None):
+        self.queue.put((line, echo)) # blocks if the writer falls behind by queue_size lines
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            with phase("logging"):
+                for item in batch:
+                    if item is None:
+                        self.file.flush()
+                        return
+                    line, echo = item
+                    if echo is not None:
+                        print(echo)
+                    self.file.write(line)
+                    self.size += len(line.encode("utf-8"))
+                    if self.max_bytes and self.size >= self.max_bytes:
+                        self._rotate()
+                self.file.flush()
+
+    def _rotate(self):
+        self.file.close()
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.filename}.{i}"):
+                os.replace(f"{self.filename}.{i}", f"{self.filename}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.filename, f"{self.filename}.1")
+        self.file = open(self.filename, "w", encoding="utf-8")
+        self.size = 0
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        self.file.close()
+
+def log_start(filename=DEFAULT_LOGFILE, print_console=False, structured=False, max_bytes=None, backups=3):
+    global LOGFILE, PRINT_CONSOLE, STRUCTURED
+    log_end()
+    if structured:
+        LOGFILE = BufferedWriter(filename, max_bytes=max_bytes, backups=backups)
+    else:
+        LOGFILE = open(filename, "w")
     PRINT_CONSOLE = print_console
+    STRUCTURED = structured
 
 def log_message(message: str):
-    global LOGFILE
     if LOGFILE is None:
-        log_start()
-    LOGFILE.write(message + "\n")
-    LOGFILE.flush()
-    if PRINT_CONSOLE:
-        print(message + "\n")
-    
+        return
+    with phase("logging"):
+        if STRUCTURED:
+            _write_event("message", {"msg": message}, echo=message + "\n" if PRINT_CONSOLE else None)
+        else:
+            LOGFILE.write(message + "\n")
+            LOGFILE.flush()
+            if PRINT_CONSOLE:
+                print(message + "\n")
+
+def log_event(event_type, **fields):
+    """
+    Record a typed event. Only structured logs keep events; text logs already
+    have the matching messages.
+    """
+    if event_type not in EVENT_TYPES:
+        raise ValueError(f"Invalid event type: {event_type}. Supported types are: {', '.join(EVENT_TYPES)}.")
+    if LOGFILE is None:
+        return
+    if STRUCTURED:
+        with phase("logging"):
+            _write_event(event_type, fields)
+
+def _write_event(event_type, fields, echo=None):
+    record = {"t": round(time.time(), 6), "type": event_type}
+    record.update(fields)
+    LOGFILE.write(json.dumps(record, ensure_ascii=False, default=str) + "\n", echo)
+
 def log_end():
     global LOGFILE
     if LOGFILE:
         LOGFILE.close()
         LOGFILE = None
-    
\ No newline at end of file
+
+atexit.register(log_end) # flush a structured log even if the game ends with an error
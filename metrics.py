@@ -0,0 +1,159 @@
+# Copyright (c) 2025 Kevin Lin
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import os
+import math
+import threading
+import contextvars
+from contextlib import contextmanager
+from collections import defaultdict
+
+'''
+In-process metrics.
+Every LLM call (see blmp.BLMPClient) records its wall time, time to first byte,
+prompt and completion tokens, estimated cost, retries and errors, and the TTS
+worker records synthesis and playback time per line. Samples are kept raw with
+their tags, so summaries can be cut by any tag: model, role (player, dealer),
+player, round, voice. Callers tag the calls they make with tagged(), which holds
+for the current thread (or task) only.
+
+REGISTRY.report() summarizes with p50/p95/p99, and write_prometheus() writes the
+Prometheus text format, where seconds become summaries and everything else
+counters, labelled by model, role and player.
+'''
+
+# name: (Prometheus type, help). Values of "summary" metrics are also summarized by report()
+METRICS = {
+    "llm_call_seconds": ("summary", "Wall time of LLM calls, including retries"),
+    "llm_ttfb_seconds": ("summary", "Time to the first byte of the response of the last attempt"),
+    "llm_prompt_tokens": ("counter", "Prompt tokens used"),
+    "llm_completion_tokens": ("counter", "Completion tokens used"),
+    "llm_cost_dollars": ("counter", "Estimated cost"),
+    "llm_retries": ("counter", "Retried attempts"),
+    "llm_errors": ("counter", "Calls that failed after all retries"),
+    "tts_synthesis_seconds": ("summary", "Kokoro synthesis time of a line"),
+    "tts_playback_seconds": ("summary", "Time spent handing a line to the audio sink, mostly playing it"),
+}
+PROMETHEUS_PREFIX = "bluffmind_"
+PROMETHEUS_LABELS = ("model", "role", "player", "voice")
+QUANTILES = (0.5, 0.95, 0.99)
+
+_TAGS = contextvars.ContextVar("metrics_tags", default={})
+
+@contextmanager
+def tagged(**tags):
+    """
+    Tag every sample recorded in this block, on top of the tags already set.
+    """
+    token = _TAGS.set({**_TAGS.get(), **tags})
+    try:
+        yield
+    finally:
+        _TAGS.reset(token)
+
+def current_tags():
+    return _TAGS.get()
+
+def quantile(values, q):
+    """
+    Nearest-rank quantile of sorted values.
+    """
+    return values[max(0, math.ceil(q * len(values)) - 1)]
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = defaultdict(list) # name -> [(tags, value)]
+
+    def observe(self, name, value, **tags):
+        if name not in METRICS:
+            raise ValueError(f"Unknown metric: {name}")
+        tags = {**_TAGS.get(), **tags}
+        with self._lock:
+            self.samples[name].append((tags, value))
+
+    def clear(self):
+        with self._lock:
+            self.samples.clear()
+
+    def groups(self, name, by):
+        """
+        {(tag values of by): sorted values} of a metric.
+        """
+        with self._lock:
+            samples = list(self.samples.get(name, ()))
+        groups = defaultdict(list)
+        for tags, value in samples:
+            groups[tuple(tags.get(tag, "") for tag in by)].append(value)
+        return {key: sorted(values) for key, values in groups.items()}
+
+    def summary(self, name, by=("role", "model")):
+        """
+        {(tag values of by): {"count", "sum", "p50", "p95", "p99"}} of a metric.
+        """
+        result = {}
+        for key, values in self.groups(name, by).items():
+            stats = {"count": len(values), "sum": sum(values)}
+            for q in QUANTILES:
+                stats[f"p{round(q * 100)}"] = quantile(values, q)
+            result[key] = stats
+        return result
+
+    def report(self, by=("role", "model")):
+        """
+        Summary lines: latency quantiles of the timed metrics and totals of the counted ones.
+        """
+        lines = []
+        for name, (kind, _) in METRICS.items():
+            group_by = ("voice",) if name.startswith("tts_") else by
+            for key, stats in sorted(self.summary(name, group_by).items()):
+                label = " ".join(str(k) for k in key if k != "") or "all"
+                if kind == "summary":
+                    lines.append(f"{name} {label}: n={stats['count']} p50={stats['p50']:.3f} "
+                                 f"p95={stats['p95']:.3f} p99={stats['p99']:.3f} total={stats['sum']:.3f}")
+                else:
+                    lines.append(f"{name} {label}: {stats['sum']:g} over {stats['count']} calls")
+        return lines
+
+    def prometheus(self):
+        """
+        All metrics in the Prometheus text exposition format.
+        """
+        out = []
+        for name, (kind, help_text) in METRICS.items():
+            groups = self.groups(name, PROMETHEUS_LABELS)
+            if not groups:
+                continue
+            metric = PROMETHEUS_PREFIX + name + ("_total" if kind == "counter" else "")
+            out.append(f"# HELP {metric} {help_text}")
+            out.append(f"# TYPE {metric} {kind}")
+            for key, values in sorted(groups.items()):
+                labels = [f'{tag}="{_escape(value)}"' for tag, value in zip(PROMETHEUS_LABELS, key) if value != ""]
+                if kind == "counter":
+                    out.append(f"{metric}{{{','.join(labels)}}} {sum(values):g}")
+                    continue
+                for q in QUANTILES:
+                    quantile_label = f'quantile="{q}"'
+                    out.append(f"{metric}{{{','.join(labels + [quantile_label])}}} {quantile(values, q):.6f}")
+                out.append(f"{metric}_sum{{{','.join(labels)}}} {sum(values):.6f}")
+                out.append(f"{metric}_count{{{','.join(labels)}}} {len(values)}")
+        return "\n".join(out) + "\n"
+
+    def write_prometheus(self, path):
+        """
+        Write prometheus() to path, replacing the file at once so a scraper never reads half of it.
+        """
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.prometheus())
+        os.replace(tmp, path)
+
+REGISTRY = MetricsRegistry()
+
+def observe(name, value, **tags):
+    REGISTRY.observe(name, value, **tags)
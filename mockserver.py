@@ -0,0 +1,301 @@
+# Copyright (c) 2025 Kevin Lin
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import re
+import ast
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+'''
+Local stand-in for the OpenRouter chat-completions API (and Ollama's /api/chat),
+for load testing BluffMind without the network.
+
+Player requests (the ones with a response format) are answered with a random but
+legal move for the hand found in the prompt. Dealer requests (the ones with tools)
+are answered with the tool call the rules require next, worked out from the tool
+calls and results already in the conversation, or, where older calls were left
+out, the next step named in the dealer's state summary, so a dealer driven by
+this server plays complete games. Requests with neither (e.g. dealer comments)
+get a line of text. Scripted responses can be queued up front,
+and latency and 429/5xx errors can be injected.
+
+Point the clients at it with e.g.
+    OPENROUTER_BASE_URL=http://127.0.0.1:8000/v1 OPENROUTER_API_KEY=mock python bm.py -b
+or with "base_url" in a player's config.
+'''
+
+CARDS_RE = re.compile(r"Your cards are: (\[[^\]]*\])")
+NEXT_RE = re.compile(r"Next: call '(\w+)' with (\{.*\})\.")
+NAMES_RE = re.compile(r"(?:play|player) (\d) as (.+?)(?:, and |, |\. |\.\n|\n)")
+
+def parse_latency(spec):
+    """
+    Parse a latency distribution, in seconds, into a sampler:
+    "fixed:0.2", "uniform:0.1,0.5", "normal:0.5,0.1", "lognormal:-1,0.5" or "exp:0.3".
+    """
+    kind, _, params = spec.partition(":")
+    p = [float(x) for x in params.split(",")] if params else []
+    if kind == "fixed":
+        return lambda rng: p[0] if p else 0.0
+    elif kind == "uniform":
+        return lambda rng: rng.uniform(p[0], p[1])
+    elif kind == "normal":
+        return lambda rng: max(0.0, rng.gauss(p[0], p[1]))
+    elif kind == "lognormal":
+        return lambda rng: rng.lognormvariate(p[0], p[1])
+    elif kind == "exp":
+        return lambda rng: rng.expovariate(1 / p[0])
+    raise ValueError(f"Invalid latency distribution: {spec}")
+
+class MockBackend:
+    def __init__(self, latency="fixed:0", error_rate=0.0, error_codes=(429, 500, 503),
+                 challenge_rate=0.3, comment_rate=0.0, multi_call_rate=0.0, script=None, seed=None):
+        self.latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.error_codes = list(error_codes)
+        self.challenge_rate = challenge_rate
+        self.comment_rate = comment_rate
+        self.multi_call_rate = multi_call_rate
+        self.script = {"player": list((script or {}).get("player", [])),
+                       "dealer": list((script or {}).get("dealer", []))}
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "errors": 0, "player": 0, "dealer": 0}
+
+    def _scripted(self, kind):
+        with self.lock:
+            return self.script[kind].pop(0) if self.script[kind] else None
+
+    def handle(self, body):
+        """
+        Return (status, reply) for a request body, where reply is either an error
+        message or a dict with "content" and "tool_calls" (name, arguments).
+        """
+        with self.lock:
+            self.stats["requests"] += 1
+            delay = self.latency(self.rng)
+            fail = self.rng.random() < self.error_rate
+            code = self.rng.choice(self.error_codes) if fail else 200
+        time.sleep(delay)
+        if fail:
+            with self.lock:
+                self.stats["errors"] += 1
+            return code, f"Injected error {code}"
+
+        if body.get("tools"):
+            with self.lock:
+                self.stats["dealer"] += 1
+            return 200, self._scripted("dealer") or self.dealer_move(body["messages"])
+        if not body.get("response_format") and not body.get("format"):
+            # free text, e.g. a dealer comment
+            return 200, {"content": "The mock announcer is watching you all.", "tool_calls": []}
+        with self.lock:
+            self.stats["player"] += 1
+        move = self._scripted("player") or self.player_move(body)
+        return 200, {"content": json.dumps(move, ensure_ascii=False), "tool_calls": []}
+
+    def player_move(self, body):
+        prompt = body["messages"][-1]["content"]
+        match = CARDS_RE.search(prompt)
+        hand = ast.literal_eval(match.group(1)) if match else []
+        schema = self._player_schema(body)
+        moves = schema.get("move", {}).get("enum", ["CHALLENGE", "PLAY"])
+        can_challenge = "CHALLENGE" in moves and "There is no last player" not in prompt
+
+        with self.lock:
+            if can_challenge and (not hand or self.rng.random() < self.challenge_rate):
+                return {"reason": "Mock challenge.", "move": "CHALLENGE", "played_cards": [], "taunt": "Caught you!"}
+            options = schema.get("played_cards", {}).get("enum")
+            if options:
+                # a per-turn schema already lists the legal plays
+                played = self.rng.choice([o for o in options if o]) if any(options) else []
+            else:
+                played = self.rng.sample(hand, self.rng.randint(1, min(3, len(hand)))) if hand else []
+        return {"reason": "Mock play.", "move": "PLAY", "played_cards": played, "taunt": "Beat that."}
+
+    def _player_schema(self, body):
+        fmt = body.get("response_format") or body.get("format") or {}
+        if isinstance(fmt, dict):
+            fmt = fmt.get("json_schema", {}).get("schema", fmt)
+            return fmt.get("properties", {})
+        return {}
+
+    def dealer_move(self, messages):
+        """
+        Work out the dealer's next legal tool call from the conversation so far.
+        """
+        names = dict(NAMES_RE.findall(messages[0].get("content") or "")) if messages else {}
+        calls = {}
+        history = []  # (tool name, arguments, result) in order
+        for m in messages:
+            for call in m.get("tool_calls") or []:
+                args = call["function"].get("arguments") or {}
+                calls[call.get("id")] = (call["function"]["name"], json.loads(args) if isinstance(args, str) else args)
+            if m.get("role") == "tool":
+                name, args = calls.get(m.get("tool_call_id"), (m.get("name"), {}))
+                history.append((name, args, json.loads(m["content"]) if m.get("content") else None))
+
+        def call(name, **arguments):
+            comment = None
+            tool_calls = [(name, arguments)]
+            with self.lock:
+                if self.rng.random() < self.comment_rate:
+                    comment = "COMMENT: The mock dealer is watching you all."
+                # the next round's order doesn't need the result of these, so it can be asked for along
+                if name in ("start_game", "prompt_russian_roulette") and self.rng.random() < self.multi_call_rate:
+                    tool_calls.append(("prompt_round_order", {}))
+            return {"content": comment or "", "tool_calls": tool_calls}
+
+        # where the calls the rules need were left out of the conversation, follow the state summary
+        summary = next((match for m in messages if m.get("role") == "user"
+                        and (match := NEXT_RE.search(m.get("content") or ""))), None)
+        if not history:
+            if summary is not None:
+                return call(summary.group(1), **json.loads(summary.group(2)))
+            started = any("has already been started" in (m.get("content") or "") for m in messages)
+            return call("prompt_round_order") if started else call("start_game")
+        try:
+            return self._dealer_rules(history, names, call)
+        except (LookupError, StopIteration):
+            if summary is None:
+                raise
+            return call(summary.group(1), **json.loads(summary.group(2)))
+
+    def _dealer_rules(self, history, names, call):
+        order = next((r for n, _, r in reversed(history) if n == "prompt_round_order"), [])
+        name, args, result = history[-1]
+        if name == "start_game" or name == "prompt_russian_roulette":
+            return call("prompt_round_order")
+        if name == "prompt_round_order":
+            if len(result) <= 1:
+                winner = names.get(str(result[0]), f"Player {result[0]}") if result else "Nobody"
+                return {"content": f"GAME OVER: {winner} won!", "tool_calls": []}
+            return call("start_round", players=result)
+        if name == "start_round":
+            return call("prompt_player_turn", player_index=order[0], last_player_index=None)
+        if name == "prompt_player_turn":
+            player, last = args["player_index"], args.get("last_player_index")
+            if result:
+                following = order[(order.index(player) + 1) % len(order)] if player in order else order[0]
+                return call("prompt_player_turn", player_index=following, last_player_index=player)
+            last_cards = next(r for n, a, r in reversed(history)
+                              if n == "prompt_player_turn" and a["player_index"] == last)
+            return call("prompt_check_cards", cards=last_cards)
+        if name == "prompt_check_cards":
+            turn = next(a for n, a, _ in reversed(history) if n == "prompt_player_turn")
+            loser = turn["player_index"] if result else turn["last_player_index"]
+            return call("prompt_russian_roulette", player_index=loser)
+        return call("prompt_round_order")
+
+def _estimate_tokens(body):
+    return len(json.dumps(body.get("messages", []), ensure_ascii=False)) // 4
+
+def make_handler(backend):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like the real APIs
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, payload, headers=None):
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            self._send(200, backend.stats)
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if self.path.endswith("/api/generate"):
+                # Ollama model load / warmup
+                return self._send(200, {"model": body.get("model"), "response": "", "done": True})
+            ollama = self.path.endswith("/api/chat")
+            status, reply = backend.handle(body)
+            if status != 200:
+                headers = {"Retry-After": "1"} if status == 429 else None
+                if ollama:
+                    return self._send(status, {"error": reply}, headers)
+                return self._send(status, {"error": {"message": reply, "code": status}}, headers)
+
+            prompt_tokens = _estimate_tokens(body)
+            completion_tokens = len(reply["content"]) // 4 + 10 * len(reply["tool_calls"])
+            if ollama:
+                message = {"role": "assistant", "content": reply["content"]}
+                if reply["tool_calls"]:
+                    message["tool_calls"] = [{"function": {"name": n, "arguments": a}} for n, a in reply["tool_calls"]]
+                return self._send(200, {
+                    "model": body.get("model"), "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                    "message": message, "done": True, "done_reason": "stop",
+                    "prompt_eval_count": prompt_tokens, "eval_count": completion_tokens,
+                })
+
+            message = {"role": "assistant", "content": reply["content"]}
+            if reply["tool_calls"]:
+                message["tool_calls"] = [{
+                    "id": f"call_{time.monotonic_ns()}_{i}", "type": "function",
+                    "function": {"name": n, "arguments": json.dumps(a)},
+                } for i, (n, a) in enumerate(reply["tool_calls"])]
+            self._send(200, {
+                "id": f"mock-{time.monotonic_ns()}", "object": "chat.completion", "created": int(time.time()),
+                "model": body.get("model"),
+                "choices": [{"index": 0, "message": message,
+                             "finish_reason": "tool_calls" if reply["tool_calls"] else "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens},
+            })
+    return Handler
+
+def start_server(host="127.0.0.1", port=8000, **backend_options):
+    """
+    Start the server on a background thread and return it. Use server.shutdown() to stop.
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(MockBackend(**backend_options)))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stand-in server for BluffMind")
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Host to bind')
+    parser.add_argument('-p', '--port', type=int, default=8000, help='Port to bind')
+    parser.add_argument('--latency', type=str, default='fixed:0', help='Latency distribution, e.g. fixed:0.2, uniform:0.1,0.5, normal:0.5,0.1, lognormal:-1,0.5, exp:0.3')
+    parser.add_argument('--error_rate', type=float, default=0.0, help='Fraction of requests that fail')
+    parser.add_argument('--error_codes', type=str, default='429,500,503', help='Comma separated status codes to inject')
+    parser.add_argument('--challenge_rate', type=float, default=0.3, help='How often mock players challenge when they can')
+    parser.add_argument('--comment_rate', type=float, default=0.0, help='How often the mock dealer adds a COMMENT')
+    parser.add_argument('--multi_call_rate', type=float, default=0.0, help='How often the mock dealer asks for the next round order along with the call before it')
+    parser.add_argument('--script', type=str, default=None, help='JSON file with {"player": [...], "dealer": [...]} responses to return first')
+    parser.add_argument('-s', '--seed', type=int, default=None, help='Seed for latency, errors and moves')
+    args = parser.parse_args()
+
+    script = None
+    if args.script:
+        with open(args.script, 'r') as f:
+            script = json.load(f)
+            # dealer entries are {"content": ..., "tool_calls": [[name, arguments], ...]}
+            script["dealer"] = [{"content": d.get("content", ""), "tool_calls": [tuple(c) for c in d.get("tool_calls", [])]}
+                                for d in script.get("dealer", [])]
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(MockBackend(
+        latency=args.latency, error_rate=args.error_rate,
+        error_codes=[int(c) for c in args.error_codes.split(",")],
+        challenge_rate=args.challenge_rate, comment_rate=args.comment_rate, multi_call_rate=args.multi_call_rate,
+        script=script, seed=args.seed)))
+    server.daemon_threads = True
+    print(f"Mock server listening on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,53 @@
+# Copyright (c) 2025 Kevin Lin
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+from math import comb
+
+'''
+Exact challenge odds.
+A claim of k table cards is honest if all k cards are the table card or Jokers.
+To a player, the cards they were not dealt (the other hands and the undealt
+cards) are a uniformly shuffled pool of the 20 card deck minus their own 5, so
+the chance that k cards from that pool all match is hypergeometric:
+C(m, k) / C(u, k), with u unseen cards of which m match. Cards played earlier
+in the round are face down and do not change this; the player's own played
+cards count as seen. All values are precomputed in HONEST_TABLE.
+'''
+
+DECK = {"Q": 6, "K": 6, "A": 6, "Joker": 2}
+DECK_SIZE = sum(DECK.values())
+HAND_SIZE = 5
+UNSEEN = DECK_SIZE - HAND_SIZE
+MATCHING = DECK["Q"] + DECK["Joker"] # table cards and Jokers in the deck, the same for every table card
+
+# HONEST_TABLE[s][k]: probability that k unseen cards all match, when s of your own dealt cards match
+HONEST_TABLE = [
+    [comb(MATCHING - seen, k) / comb(UNSEEN, k) for k in range(HAND_SIZE + 1)]
+    for seen in range(HAND_SIZE + 1)
+]
+
+def matching_cards(cards, table_card):
+    return sum(1 for card in cards if card == table_card or card == "Joker")
+
+def honest_probability(k, table_card, hand, played=()):
+    """
+    Probability that another player's claim of k table cards is honest, for a
+    player holding hand who has already played the cards in played this round.
+    """
+    return HONEST_TABLE[matching_cards(hand, table_card) + matching_cards(played, table_card)][k]
+
+def odds_hint(k, table_card, hand, played=()):
+    """
+    One line for the player prompt with the odds of the last claim.
+    """
+    p = honest_probability(k, table_card, hand, played)
+    return (f"Odds: {k} random cards from the {UNSEEN} cards you have not seen would all be "
+            f"{table_card} or Joker with probability {p:.0%}.\n")
+
+if __name__ == "__main__":
+    print("Probability that a claim of k cards is honest, by your own matching cards")
+    print("mine  " + "  ".join(f"k={k}" for k in range(1, 4)))
+    for seen, row in enumerate(HONEST_TABLE):
+        print(f"{seen:4d}  " + "  ".join(f"{p:.2f}" for p in row[1:4]))
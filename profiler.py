@@ -0,0 +1,173 @@
+# Copyright (c) 2025 Kevin Lin
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import re
+import time
+import threading
+from contextlib import nullcontext
+from collections import defaultdict
+
+'''
+Phase profiler, enabled with bm.py --profile.
+The game's phases (dealing, building prompts, waiting for LLMs, parsing their
+answers, synthesizing and playing speech, waiting for speech, drawing the
+screen, logging) are timed with nested phase() blocks, in wall time and on
+every thread. cProfile only sees the thread it runs in and blames a wait on
+whatever call blocked; here a wait is a phase of its own (llm_wait,
+prefetch_wait, audio_wait), and the work it waits for shows up under the
+thread doing it (turn, tts, comment, log-writer, screen).
+
+write_collapsed() writes the self time of every stack, rooted at its thread,
+in the collapsed stack format ("main;llm_wait;rate_limit_wait 1234", in
+microseconds) read by flamegraph.pl, inferno and speedscope.
+
+The main thread runs the game loop, so its time is the game's critical path.
+turn() splits it into turns, from one move to the next, and turn_report()
+breaks every turn down into the self time of its phases, plus "other" for game
+logic outside any phase. Phases nest per thread; they are not meant for
+asyncio tasks. While the profiler is off, phase() returns a shared no-op.
+'''
+
+_NULL = nullcontext()
+_THREAD_SUFFIX_RE = re.compile(r" \(.*\)$|[-_]\d+$")
+
+def thread_root(thread):
+    """
+    The root frame of a thread's stacks: its name without pool numbers, e.g. turn_0 -> turn.
+    """
+    if thread is threading.main_thread():
+        return "main"
+    return _THREAD_SUFFIX_RE.sub("", thread.name).replace(";", "_").replace(" ", "_")
+
+class _Phase:
+    __slots__ = ("profiler", "name", "start", "children")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.children = 0.0
+        self.profiler._stack().append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = time.perf_counter() - self.start
+        stack = self.profiler._stack()
+        stack.pop()
+        if len(stack) > 1:
+            stack[-1].children += elapsed
+        self.profiler._record(stack, self.name, elapsed, elapsed - self.children)
+        return False
+
+class Turn:
+    '''
+    One turn of the main thread: wall time and the self time of each phase in it.
+    '''
+    def __init__(self, label, start):
+        self.label = label
+        self.start = start
+        self.end = None
+        self.phases = defaultdict(float)
+
+    def seconds(self, now=None):
+        return (self.end if self.end is not None else (now or time.perf_counter())) - self.start
+
+    def breakdown(self, now=None):
+        """
+        [(phase, seconds)] by decreasing time, with "other" for the time outside any phase.
+        """
+        other = self.seconds(now) - sum(self.phases.values())
+        return sorted(list(self.phases.items()) + [("other", max(0.0, other))], key=lambda item: -item[1])
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.started = None
+        self.stacks = defaultdict(float) # "thread;phase;..." -> self seconds
+        self.turns = []
+        self._main_phased = 0.0 # time of the main thread in top level phases
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def start(self):
+        self.enabled = True
+        self.started = time.perf_counter()
+        self.turns = [Turn("start", self.started)]
+
+    def phase(self, name):
+        """
+        Time the block as phase name, nested in the phases open on this thread.
+        """
+        if not self.enabled:
+            return _NULL
+        return _Phase(self, name)
+
+    def turn(self, label):
+        """
+        Start the next turn of the critical path breakdown.
+        """
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        with self._lock:
+            self.turns[-1].end = now
+            self.turns.append(Turn(label, now))
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = [thread_root(threading.current_thread())]
+        return stack
+
+    def _record(self, stack, name, elapsed, self_time):
+        path = ";".join([stack[0]] + [p.name for p in stack[1:]] + [name])
+        main = threading.current_thread() is threading.main_thread()
+        with self._lock:
+            self.stacks[path] += self_time
+            if main:
+                self.turns[-1].phases[name] += self_time
+                if len(stack) == 1:
+                    self._main_phased += elapsed
+
+    def collapsed(self):
+        """
+        Lines of the collapsed stack format, in microseconds of self time.
+        """
+        with self._lock:
+            stacks = dict(self.stacks)
+            stacks["main"] = max(0.0, time.perf_counter() - self.started - self._main_phased)
+        return [f"{path} {round(seconds * 1e6)}" for path, seconds in sorted(stacks.items()) if seconds >= 5e-7]
+
+    def write_collapsed(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(self.collapsed()) + "\n")
+
+    def turn_report(self):
+        """
+        Lines breaking the critical path down by turn, then in total.
+        """
+        now = time.perf_counter()
+        with self._lock:
+            turns = list(self.turns)
+        lines = []
+        total = defaultdict(float)
+        for turn in turns:
+            breakdown = turn.breakdown(now)
+            lines.append(f"{turn.label}: {turn.seconds(now):.3f}s = "
+                         + " ".join(f"{name} {seconds:.3f}" for name, seconds in breakdown if seconds >= 5e-4))
+            for name, seconds in breakdown:
+                total[name] += seconds
+        wall = sum(total.values())
+        lines.append(f"critical path: {wall:.3f}s = " + " ".join(
+            f"{name} {seconds:.3f} ({seconds / wall:.0%})" for name, seconds in sorted(total.items(), key=lambda item: -item[1])
+            if seconds >= 5e-4))
+        return lines
+
+PROFILER = Profiler()
+
+def phase(name):
+    return PROFILER.phase(name)
@@ -0,0 +1,189 @@
+# Copyright (c) 2025 Kevin Lin
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import os
+import re
+import time
+import struct
+import threading
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+    import msvcrt
+
+'''
+Token bucket rate limits for LLM requests.
+Limits are set per provider ("openrouter", "ollama") and per model name, for
+requests and for tokens per minute. A request reserves one request and its
+estimated tokens from every bucket that applies, and waits until all of them
+are back in budget, so requests go out at the sustained rate instead of being
+answered with 429s. Once the response reports the tokens actually used, the
+difference to the estimate is settled.
+
+One RateLimiter is shared by all clients of a process, see blmp.set_rate_limiter.
+With a shared directory, every bucket is kept in a small file there, locked
+while it is updated, so all processes using the directory (e.g. tournament
+workers) share one budget.
+'''
+
+DEFAULT_COMPLETION_TOKENS = 256 # expected answer size, added to the prompt estimate
+_STATE = struct.Struct("<dd") # level, last update (time.time())
+
+class RateLimitExceeded(Exception):
+    '''
+    A request would have to wait for its rate limit past its deadline. Not
+    retried (see retry.py), as waiting again can only leave less time.
+    '''
+    pass
+
+def message_tokens(message):
+    """
+    Rough token count of a message, or of anything else sent along, 4 characters per token.
+    """
+    return len(str(message)) // 4
+
+def estimate_tokens(messages, extra=None):
+    """
+    Rough token count of a request plus the expected answer.
+    """
+    tokens = sum(message_tokens(m) for m in messages) + (message_tokens(extra) if extra is not None else 0)
+    return tokens + DEFAULT_COMPLETION_TOKENS
+
+def _lock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+
+def _unlock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+class TokenBucket:
+    '''
+    rate units per second, up to capacity. Reservations may take the level below
+    zero, the caller then waits until it is back at zero. Later callers queue
+    behind it, as they see the lower level.
+    '''
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = time.time()
+        self._lock = threading.Lock()
+
+    def _refill(self, level, updated, now):
+        return min(self.capacity, level + (now - updated) * self.rate)
+
+    def _apply(self, level, updated, now, amount):
+        # a refund (negative amount) after a refill must not lift the level above capacity
+        return min(self.capacity, self._refill(level, updated, now) - amount)
+
+    def _take(self, amount):
+        now = time.time()
+        self.level = self._apply(self.level, self.updated, now, amount)
+        self.updated = now
+        return self.level
+
+    def reserve(self, amount):
+        """
+        Take amount, a negative amount gives it back. Returns the seconds to wait before using it.
+        """
+        with self._lock:
+            level = self._take(amount)
+        return max(0.0, -level / self.rate)
+
+class SharedTokenBucket(TokenBucket):
+    '''
+    A token bucket kept in a file, shared by every process that uses the file.
+    '''
+    def __init__(self, rate, capacity, path):
+        super().__init__(rate, capacity)
+        self.path = path
+
+    def _take(self, amount):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        with os.fdopen(fd, "r+b") as f:
+            _lock_file(f)
+            try:
+                data = f.read(_STATE.size)
+                now = time.time()
+                level, updated = _STATE.unpack(data) if len(data) == _STATE.size else (self.capacity, now)
+                level = self._apply(level, updated, now, amount)
+                f.seek(0)
+                f.write(_STATE.pack(level, now))
+                f.flush()
+            finally:
+                _unlock_file(f)
+        return level
+
+class RateLimit:
+    '''
+    Request and token budgets of one provider or model. Either may be None for no limit.
+    A full minute of budget can be used at once, as providers count per minute.
+    '''
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, path=None):
+        self.requests = self._bucket(requests_per_minute, path and path + ".requests")
+        self.tokens = self._bucket(tokens_per_minute, path and path + ".tokens")
+
+    @staticmethod
+    def _bucket(per_minute, path):
+        if per_minute is None:
+            return None
+        if per_minute <= 0:
+            raise ValueError(f"Rate limits must be positive, got {per_minute}.")
+        if path is None:
+            return TokenBucket(per_minute / 60, per_minute)
+        return SharedTokenBucket(per_minute / 60, per_minute, path)
+
+class RateLimiter:
+    '''
+    Rate limits by provider and model name, e.g.
+    {"openrouter": {"requests_per_minute": 20}, "google/gemini-2.5-flash": {"tokens_per_minute": 100000}}
+    '''
+    def __init__(self, limits, shared_dir=None):
+        if shared_dir is not None:
+            os.makedirs(shared_dir, exist_ok=True)
+        self.limits = {}
+        for key, limit in limits.items():
+            path = os.path.join(shared_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", key)) if shared_dir is not None else None
+            self.limits[key] = RateLimit(limit.get("requests_per_minute"), limit.get("tokens_per_minute"), path)
+        self.shared_dir = shared_dir
+        self.throttled = 0 # requests that had to wait
+        self.waited = 0.0 # seconds waited in total
+
+    def _buckets(self, provider, model, kind):
+        return [bucket for key in (provider, model) if (limit := self.limits.get(key)) is not None
+                and (bucket := getattr(limit, kind)) is not None]
+
+    def acquire(self, provider, model, tokens, timeout=None):
+        """
+        Reserve one request and tokens for model. Returns the seconds to wait before
+        sending it. Raises RateLimitExceeded, reserving nothing, if that is more than timeout.
+        """
+        reserved = [(bucket, 1) for bucket in self._buckets(provider, model, "requests")]
+        reserved += [(bucket, tokens) for bucket in self._buckets(provider, model, "tokens")]
+        wait = max((bucket.reserve(amount) for bucket, amount in reserved), default=0.0)
+        if timeout is not None and wait > timeout:
+            for bucket, amount in reserved:
+                bucket.reserve(-amount)
+            raise RateLimitExceeded(f"Rate limit for {model} needs a {wait:.1f}s wait, only {timeout:.1f}s left")
+        if wait > 0:
+            self.throttled += 1
+            self.waited += wait
+        return wait
+
+    def settle(self, provider, model, tokens):
+        """
+        Take tokens more (or give back, if negative) once the actual usage of a request is known.
+        """
+        for bucket in self._buckets(provider, model, "tokens"):
+            bucket.reserve(tokens)
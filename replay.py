@@ -0,0 +1,88 @@
+# Copyright (c) 2025 Kevin Lin
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import os
+import sys
+import json
+import time
+import argparse
+from collections import deque
+
+import bm
+from log import log_start, log_end
+from state import decode_move
+
+'''
+Game replay.
+A game record is the result of BaseGame.result(): the seed, the player names
+and the moves, one code per turn (see state.encode_move). Dealing, seating,
+table cards and RR positions all come from the game's own random.Random(seed),
+so playing the recorded moves again in program mode recomputes the whole game
+exactly, without any LLM or TTS calls. Tournament result files are records,
+one per line, as is the file written by bm.py --record.
+Agent mode games replay the same way if the dealer followed the rules.
+'''
+
+class ReplayError(Exception):
+    pass
+
+class ReplayPlayer(bm.Player):
+    '''
+    A player whose moves are taken from a record, shared by all players of the game.
+    '''
+    def __init__(self, name, moves):
+        super().__init__(name, "Replay", "", "am_echo")
+        self.moves = moves
+
+    def decide_move(self, last_player, table_card):
+        if not self.moves:
+            raise ReplayError(f"The record has no move left for {self}.")
+        cards = decode_move(self.moves.popleft())
+        if not cards:
+            return bm.Move("CHALLENGE", [], "", last_player=last_player)
+        if not bm.Hand.from_cards(self.cards).contains(bm.Hand.from_cards(cards)):
+            raise ReplayError(f"{self} cannot play {cards} with hand {self.cards}, the record does not match the seed.")
+        return bm.Move("PLAY", cards, "")
+
+def replay(record):
+    """
+    Play a recorded game again and return its result.
+    """
+    moves = deque(record["moves"].split())
+    players = [ReplayPlayer(name, moves) for name in record["players"]]
+    game = bm.GameProg(players, seed=record["seed"])
+    game.play()
+    if moves:
+        raise ReplayError(f"The game ended with {len(moves)} recorded moves left.")
+    return game.result()
+
+def read_records(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded BluffMind games")
+    parser.add_argument('records', type=str, help='File with one game record per line, e.g. a tournament result file')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Print every replayed game')
+    args = parser.parse_args()
+
+    log_start(os.devnull)
+    games = mismatches = 0
+    start = time.perf_counter()
+    for record in read_records(args.records):
+        result = replay(record)
+        games += 1
+        same = all(result[k] == record[k] for k in ("winner", "rounds", "kill_order", "rr_shots") if k in record)
+        if not same:
+            mismatches += 1
+            print(f"Game with seed {record['seed']} replayed differently: {result}")
+        elif args.verbose:
+            print(json.dumps(result))
+    elapsed = time.perf_counter() - start
+    log_end()
+    print(f"Replayed {games} games in {elapsed:.2f}s ({1000 * elapsed / max(games, 1):.2f} ms per game), {mismatches} mismatches")
+    sys.exit(1 if mismatches else 0)
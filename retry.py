@@ -0,0 +1,155 @@
+# Copyright (c) 2025 Kevin Lin
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import re
+import ast
+import json
+import time
+import random
+import asyncio
+from email.utils import parsedate_to_datetime
+
+'''
+Retries for LLM requests.
+Failed requests are retried a bounded number of times when the error is
+transient (429, 5xx, timeouts, dropped connections), waiting a jittered
+exponential backoff in between, or as long as the server asks in Retry-After.
+A deadline bounds the total time; once it would pass, the last error is raised
+and the caller falls back, see Player._play_card_llm.
+repair_json recovers the JSON object from responses with code fences, text
+around the object, trailing commas or Python literals.
+'''
+
+RETRY_CODES = (408, 409, 425, 429, 500, 502, 503, 504)
+
+class RetryPolicy:
+    def __init__(self, attempts=4, base_delay=0.5, max_delay=8.0, retry_codes=RETRY_CODES):
+        self.attempts = attempts # including the first one
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_codes = tuple(retry_codes)
+
+    def retryable(self, e):
+        code = getattr(e, "status_code", None)
+        if code is not None:
+            return code in self.retry_codes
+        return is_connection_error(e)
+
+    def backoff(self, attempt, retry_after=None):
+        """
+        Seconds to wait before retry number attempt (0 based): full jitter over an
+        exponentially growing window, unless the server said how long to wait.
+        """
+        if retry_after is not None:
+            return retry_after
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+NO_RETRY = RetryPolicy(attempts=1)
+
+def is_connection_error(e):
+    if isinstance(e, (ConnectionError, TimeoutError)):
+        return True
+    # openai and httpx errors, without importing either
+    return any("Timeout" in cls.__name__ or "Connect" in cls.__name__ or cls.__name__ == "RemoteProtocolError"
+               for cls in type(e).__mro__)
+
+def retry_after(e):
+    """
+    Seconds the server asked to wait in a Retry-After (or retry-after-ms) header, if any.
+    """
+    headers = getattr(getattr(e, "response", None), "headers", None)
+    if not headers:
+        return None
+    if (value := headers.get("retry-after-ms")) is not None:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    if (value := headers.get("retry-after")) is not None:
+        try:
+            return float(value)
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                return None
+    return None
+
+def _next_delay(policy, attempt, e, deadline):
+    """
+    Seconds to wait before retrying after error e, or None to give up.
+    """
+    if attempt + 1 >= policy.attempts or not policy.retryable(e):
+        return None
+    delay = policy.backoff(attempt, retry_after(e))
+    if deadline is not None and time.monotonic() + delay >= deadline:
+        return None
+    return delay
+
+def remaining(deadline):
+    return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+def retry_call(fn, policy, deadline=None, on_retry=None):
+    """
+    Call fn(timeout) until it returns, retrying transient errors as the policy
+    allows. timeout is the time left until the deadline, or None.
+    """
+    attempt = 0
+    while True:
+        try:
+            return fn(remaining(deadline))
+        except Exception as e:
+            delay = _next_delay(policy, attempt, e, deadline)
+            if delay is None:
+                raise
+            if on_retry is not None:
+                on_retry(attempt, e, delay)
+            time.sleep(delay)
+            attempt += 1
+
+async def aretry_call(fn, policy, deadline=None, on_retry=None):
+    """
+    retry_call for a coroutine function.
+    """
+    attempt = 0
+    while True:
+        try:
+            return await fn(remaining(deadline))
+        except Exception as e:
+            delay = _next_delay(policy, attempt, e, deadline)
+            if delay is None:
+                raise
+            if on_retry is not None:
+                on_retry(attempt, e, delay)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+_FENCE_RE = re.compile(r"^```[a-zA-Z]*\s*|\s*```$")
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+
+def repair_json(text):
+    """
+    Parse the JSON object in text, repairing common mistakes. Returns a dict, or None.
+    """
+    try:
+        value = json.loads(text)
+        return value if isinstance(value, dict) else None
+    except (TypeError, ValueError):
+        pass
+    if not isinstance(text, str):
+        return None
+    text = _FENCE_RE.sub("", text.strip())
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end < start:
+        return None
+    text = _TRAILING_COMMA_RE.sub(r"\1", text[start:end + 1])
+    try:
+        value = json.loads(text)
+    except ValueError:
+        try:
+            value = ast.literal_eval(text) # single quotes, True/False/None
+        except (ValueError, SyntaxError, MemoryError, RecursionError):
+            return None
+    return value if isinstance(value, dict) else None
@@ -0,0 +1,197 @@
+# Copyright (c) 2025 Kevin Lin
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import struct
+
+'''
+Compact game state.
+A hand is a count vector of Q, K, A and Joker packed into one int, 3 bits per
+card type, so copying, comparing and hashing it is as cheap as for an int.
+PlayerState and GameState use __slots__ and small ints, and a whole game
+serializes to a few dozen bytes with to_bytes/from_bytes. Player.state() and
+BaseGame.snapshot() build them from the running game.
+Moves are recorded as short codes, see encode_move.
+'''
+
+CARD_TYPES = ("Q", "K", "A", "Joker")
+CARD_INDEX = {card: i for i, card in enumerate(CARD_TYPES)}
+_BITS = 3
+_MASK = (1 << _BITS) - 1
+CHALLENGE_CODE = "C"
+
+def encode_move(cards):
+    """
+    Encode the cards of a move, "C" for a challenge, else one letter per card, J for a Joker.
+    """
+    if not cards:
+        return CHALLENGE_CODE
+    return "".join("J" if card == "Joker" else card for card in cards)
+
+def decode_move(code):
+    if code == CHALLENGE_CODE:
+        return []
+    return ["Joker" if c == "J" else c for c in code]
+
+def legal_plays(cards, max_cards=3):
+    """
+    Every distinct multiset of 1 to max_cards cards that can be played from cards,
+    each as a sorted list.
+    """
+    counts = Hand.from_cards(cards).counts()
+    plays = [[]]
+    for card, n in zip(CARD_TYPES, counts):
+        plays = [play + [card] * k for play in plays for k in range(n + 1) if len(play) + k <= max_cards]
+    return sorted((sorted(play) for play in plays if play), key=lambda play: (len(play), play))
+
+class Hand:
+    __slots__ = ("bits",)
+
+    def __init__(self, bits=0):
+        self.bits = bits
+
+    @classmethod
+    def from_cards(cls, cards):
+        bits = 0
+        for card in cards:
+            bits += 1 << (_BITS * CARD_INDEX[card])
+        return cls(bits)
+
+    @classmethod
+    def from_counts(cls, counts):
+        bits = 0
+        for i, n in enumerate(counts):
+            bits |= n << (_BITS * i)
+        return cls(bits)
+
+    def count(self, card):
+        return (self.bits >> (_BITS * CARD_INDEX[card])) & _MASK
+
+    def counts(self):
+        return tuple((self.bits >> (_BITS * i)) & _MASK for i in range(len(CARD_TYPES)))
+
+    def cards(self):
+        """
+        The cards as a sorted list of strings, as Player.cards keeps them.
+        """
+        return sorted(card for card, n in zip(CARD_TYPES, self.counts()) for _ in range(n))
+
+    def contains(self, other):
+        """
+        True if every card of other is in this hand.
+        """
+        return all(a >= b for a, b in zip(self.counts(), other.counts()))
+
+    def remove(self, other):
+        if not self.contains(other):
+            raise ValueError(f"{other.cards()} is not part of {self.cards()}")
+        return Hand(self.bits - other.bits) # no borrows, every count is at least the other one
+
+    def add(self, other):
+        return Hand(self.bits + other.bits)
+
+    def matching(self, table_card):
+        """
+        Number of cards that pass a challenge on table_card.
+        """
+        return self.count(table_card) + self.count("Joker")
+
+    def __len__(self):
+        return sum(self.counts())
+
+    def __eq__(self, other):
+        return isinstance(other, Hand) and self.bits == other.bits
+
+    def __hash__(self):
+        return hash(self.bits)
+
+    def __repr__(self):
+        return f"Hand({self.cards()})"
+
+class PlayerState:
+    __slots__ = ("hand", "played", "rr_position", "rr_played", "alive")
+
+    def __init__(self, hand=None, played=None, rr_position=0, rr_played=0, alive=True):
+        self.hand = hand if hand is not None else Hand()
+        self.played = played if played is not None else Hand() # cards played this round
+        self.rr_position = rr_position # 1-3, 0 if not set yet
+        self.rr_played = rr_played
+        self.alive = alive
+
+    def copy(self):
+        return PlayerState(self.hand, self.played, self.rr_position, self.rr_played, self.alive) # hands are immutable
+
+    def key(self):
+        return (self.hand.bits, self.played.bits, self.rr_position, self.rr_played, self.alive)
+
+    def __eq__(self, other):
+        return isinstance(other, PlayerState) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def __repr__(self):
+        return (f"PlayerState(hand={self.hand.cards()}, played={self.played.cards()}, "
+                f"rr_position={self.rr_position}, rr_played={self.rr_played}, alive={self.alive})")
+
+class GameState:
+    '''
+    The whole game: every player's state, the seating order of the round as
+    player indices, the table card, and the last player and their claim.
+    '''
+    __slots__ = ("players", "order", "table_card", "round_number", "last_player", "last_claim")
+
+    _HEAD = struct.Struct("<BBBHBH") # players, seats, table card, round, last player, last claim
+    _PLAYER = struct.Struct("<HHB") # hand, played, rr position | rr played << 2 | alive << 4
+
+    def __init__(self, players, order=(), table_card=None, round_number=0, last_player=None, last_claim=None):
+        self.players = players
+        self.order = tuple(order)
+        self.table_card = table_card
+        self.round_number = round_number
+        self.last_player = last_player # player index or None
+        self.last_claim = last_claim if last_claim is not None else Hand()
+
+    def copy(self):
+        return GameState([p.copy() for p in self.players], self.order, self.table_card,
+                         self.round_number, self.last_player, self.last_claim)
+
+    def key(self):
+        return (tuple(p.key() for p in self.players), self.order, self.table_card,
+                self.round_number, self.last_player, self.last_claim.bits)
+
+    def __eq__(self, other):
+        return isinstance(other, GameState) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def to_bytes(self):
+        data = bytearray(self._HEAD.pack(
+            len(self.players), len(self.order),
+            CARD_INDEX[self.table_card] if self.table_card is not None else 255,
+            self.round_number,
+            self.last_player if self.last_player is not None else 255,
+            self.last_claim.bits))
+        for p in self.players:
+            data += self._PLAYER.pack(p.hand.bits, p.played.bits, p.rr_position | (p.rr_played << 2) | (int(p.alive) << 4))
+        data += bytes(self.order)
+        return bytes(data)
+
+    @classmethod
+    def from_bytes(cls, data):
+        n_players, n_seats, table, round_number, last, claim = cls._HEAD.unpack_from(data, 0)
+        offset = cls._HEAD.size
+        players = []
+        for _ in range(n_players):
+            hand, played, rr = cls._PLAYER.unpack_from(data, offset)
+            offset += cls._PLAYER.size
+            players.append(PlayerState(Hand(hand), Hand(played), rr & 3, (rr >> 2) & 3, bool(rr >> 4)))
+        order = tuple(data[offset:offset + n_seats])
+        return cls(players, order, CARD_TYPES[table] if table != 255 else None, round_number,
+                   last if last != 255 else None, Hand(claim))
+
+    def __repr__(self):
+        return (f"GameState(round={self.round_number}, table_card={self.table_card}, order={self.order}, "
+                f"last_player={self.last_player}, last_claim={self.last_claim.cards()}, players={self.players})")
@@ -0,0 +1,217 @@
+# Copyright (c) 2025 Kevin Lin
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import os
+import mmap
+import time
+import random
+import struct
+import argparse
+
+'''
+Strategy table for the "Strategy" player.
+The table is solved offline by self-play and stored as a compact binary file,
+which players map into memory, so every process of a tournament shares one copy
+through the page cache.
+
+A decision is made from an abstracted state. The table card itself does not
+matter, only which cards match it (table cards and Jokers):
+- matching and other cards in hand (0-5 each),
+- matching cards already played this round (0-5),
+- size of the last claim (0 if there is no last player, else 1-3),
+- RR shots taken by the player and by the last player (0-2),
+- players alive (2-4).
+Actions are a challenge, or playing h matching and b other cards, 1 <= h + b <= 3.
+The table keeps a weight from 0 to 255 for every action in every state.
+
+The solver plays games between copies of the current strategy. Every decision
+of a round is scored with minus the chance that its player dies in the round's
+RR shot, or, if someone else shoots, a share of that chance. The strategy then
+moves toward the best scoring action of every state, averaged over iterations
+as in fictitious play. Older scores are decayed, as they were played against
+older strategies.
+'''
+
+MAGIC = b"BMST"
+VERSION = 1
+DEFAULT_STRATEGY_FILE = "strategy.bin"
+
+ACTIONS = [("CHALLENGE", 0, 0)] + [("PLAY", h, b) for h in range(4) for b in range(4) if 1 <= h + b <= 3]
+DIMS = (6, 6, 6, 4, 3, 3, 3) # matching, other, played matching, claim, my shots, last shots, alive - 2
+HEADER = struct.Struct("<4sHH7B")
+
+def state_index(matching, other, played, claim, my_shots, last_shots, alive):
+    index = 0
+    for value, dim in zip((matching, other, min(played, 5), claim, min(my_shots, 2), min(last_shots, 2), alive - 2), DIMS):
+        index = index * dim + value
+    return index
+
+def n_states():
+    n = 1
+    for dim in DIMS:
+        n *= dim
+    return n
+
+def legal_actions(matching, other, claim):
+    return [i for i, (move, h, b) in enumerate(ACTIONS)
+            if (move == "CHALLENGE" and claim > 0) or (move == "PLAY" and h <= matching and b <= other)]
+
+def choose(weights, legal, rng=random):
+    """
+    Pick one of the legal actions with probability proportional to its weight.
+    """
+    total = sum(weights[i] for i in legal)
+    if total == 0:
+        return rng.choice(legal)
+    r = rng.random() * total
+    for i in legal:
+        r -= weights[i]
+        if r < 0:
+            return i
+    return legal[-1]
+
+class StrategyTable:
+    '''
+    A solved strategy table, memory mapped read only.
+    '''
+    def __init__(self, path=DEFAULT_STRATEGY_FILE):
+        self.path = path
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, n_actions, *dims = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION or n_actions != len(ACTIONS) or tuple(dims) != DIMS:
+            raise ValueError(f"{path} is not a version {VERSION} strategy table.")
+        if len(self.mm) != HEADER.size + n_states() * len(ACTIONS):
+            raise ValueError(f"{path} is truncated.")
+
+    def weights(self, index):
+        start = HEADER.size + index * len(ACTIONS)
+        return self.mm[start:start + len(ACTIONS)]
+
+    def decide(self, matching, other, played, claim, my_shots, last_shots, alive, rng=random):
+        """
+        Return (move, matching cards to play, other cards to play).
+        """
+        index = state_index(matching, other, played, claim, my_shots, last_shots, alive)
+        return ACTIONS[choose(self.weights(index), legal_actions(matching, other, claim), rng)]
+
+_TABLES = {}
+
+def load_table(path=DEFAULT_STRATEGY_FILE):
+    """
+    Return the table at path, mapping it only once per process.
+    """
+    path = os.path.abspath(path)
+    if path not in _TABLES:
+        _TABLES[path] = StrategyTable(path)
+    return _TABLES[path]
+
+def save_table(path, weights):
+    """
+    Write per-state action weights (lists of floats, one list per state) as a table file.
+    """
+    data = bytearray(HEADER.pack(MAGIC, VERSION, len(ACTIONS), *DIMS))
+    for row in weights:
+        total = sum(row)
+        data.extend(round(255 * w / total) if total > 0 else 0 for w in row)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path) # processes that already mapped the old file keep it
+
+def _play_games(policy, games, rng, explore, q_sum, q_count):
+    """
+    Play games between copies of policy and add every decision's score to q_sum and q_count.
+    """
+    for _ in range(games):
+        rr_position = [rng.randint(1, 3) for _ in range(4)]
+        rr_played = [0] * 4
+        alive = [True] * 4
+        while sum(alive) > 1:
+            seats = [p for p in range(4) if alive[p]]
+            rng.shuffle(seats)
+            deck = [True] * 8 + [False] * 12 # matching cards are 6 table cards and 2 Jokers
+            rng.shuffle(deck)
+            hands, played, i = {}, {}, 0
+            for p in range(4): # dealt in player order, as in shuffle_cards
+                if alive[p]:
+                    m = sum(deck[i:i + 5])
+                    hands[p] = [m, 5 - m]
+                    played[p] = 0
+                    i += 5
+            decisions = []
+            last, claim, bluffed, seat = None, 0, False, 0
+            while True:
+                p = seats[seat]
+                m, o = hands[p]
+                index = state_index(m, o, played[p], claim, rr_played[p], rr_played[last] if last is not None else 0, len(seats))
+                legal = legal_actions(m, o, claim)
+                if rng.random() < explore:
+                    a = rng.choice(legal)
+                else:
+                    a = choose(policy[index], legal, rng)
+                decisions.append((p, index, a))
+                move, h, b = ACTIONS[a]
+                if move == "CHALLENGE":
+                    shooter = last if bluffed else p
+                    break
+                hands[p] = [m - h, o - b]
+                played[p] += h
+                last, claim, bluffed = p, h + b, b > 0
+                seat = (seat + 1) % len(seats)
+
+            risk = 1.0 / (3 - rr_played[shooter]) # chance the shot kills, the bullet is in one of the remaining chambers
+            for p, index, a in decisions:
+                q_sum[index][a] += -risk if p == shooter else risk / (len(seats) - 1)
+                q_count[index][a] += 1
+            rr_played[shooter] += 1
+            if rr_played[shooter] == rr_position[shooter]:
+                alive[shooter] = False
+
+def solve(iterations=20, games=20000, explore=0.1, seed=None, decay=0.5, log=print):
+    """
+    Self-play solver. Returns the average strategy, one list of action weights per state.
+    """
+    rng = random.Random(seed)
+    states = n_states()
+    policy = [[1.0] * len(ACTIONS) for _ in range(states)]
+    average = [[0.0] * len(ACTIONS) for _ in range(states)]
+    q_sum = [[0.0] * len(ACTIONS) for _ in range(states)]
+    q_count = [[0.0] * len(ACTIONS) for _ in range(states)]
+    best_actions = [None] * states
+    for it in range(iterations):
+        start = time.perf_counter()
+        for index in range(states):
+            q_sum[index] = [q * decay for q in q_sum[index]]
+            q_count[index] = [c * decay for c in q_count[index]]
+        _play_games(policy, games, rng, explore, q_sum, q_count)
+        changed = 0
+        for index in range(states):
+            counts = q_count[index]
+            seen = [a for a in range(len(ACTIONS)) if counts[a] > 0]
+            if not seen:
+                continue
+            best = max(seen, key=lambda a: q_sum[index][a] / counts[a])
+            changed += best != best_actions[index]
+            best_actions[index] = best
+            row = average[index]
+            row[best] += 1.0
+            total = sum(row)
+            policy[index] = [w / total for w in row]
+        log(f"Iteration {it + 1}/{iterations}: {games} games in {time.perf_counter() - start:.1f}s, {changed} states changed")
+    return [row if sum(row) > 0 else [0.0] * len(ACTIONS) for row in average]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Solve the BluffMind strategy table by self-play")
+    parser.add_argument('-i', '--iterations', type=int, default=20, help='Self-play iterations')
+    parser.add_argument('-n', '--games', type=int, default=20000, help='Games per iteration')
+    parser.add_argument('-e', '--explore', type=float, default=0.1, help='Chance of a random action while solving')
+    parser.add_argument('-s', '--seed', type=int, default=None, help='Random seed')
+    parser.add_argument('-o', '--output', type=str, default=DEFAULT_STRATEGY_FILE, help='Strategy table file')
+    args = parser.parse_args()
+
+    weights = solve(args.iterations, args.games, args.explore, args.seed)
+    save_table(args.output, weights)
+    print(f"Saved {n_states()} states x {len(ACTIONS)} actions to {args.output} ({os.path.getsize(args.output)} bytes)")
@@ -0,0 +1,77 @@
+import itertools
+
+import pytest
+
+import cache
+from cache import CacheMiss, ResponseCache
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    # A strictly increasing clock, so the LRU order never depends on the timer resolution
+    ticks = itertools.count(1)
+    monkeypatch.setattr(cache.time, "time", lambda: float(next(ticks)))
+
+def make(tmp_path, **kwargs):
+    kwargs.setdefault("memory_entries", 0) # every get goes to the disk
+    return ResponseCache(str(tmp_path / "cache.sqlite"), **kwargs)
+
+def test_key_ignores_key_order_and_empty_fields():
+    assert ResponseCache.key("m", {"a": 1, "b": 2}) == ResponseCache.key("m", {"b": 2, "a": 1, "c": None, "d": []})
+    assert ResponseCache.key("m", {"a": 1}) != ResponseCache.key("m", {"a": 2})
+
+def test_readwrite_stores_and_serves(tmp_path):
+    c = make(tmp_path)
+    assert c.get("k") is None
+    c.put("k", {"content": "hi"})
+    assert c.get("k") == {"content": "hi"}
+    assert (c.hits, c.misses) == (1, 1)
+    c.close()
+
+def test_lru_eviction(tmp_path):
+    c = make(tmp_path, max_bytes=100)
+    value = "x" * 28 # 30 bytes once encoded
+    c.put("a", value)
+    c.put("b", value)
+    c.put("c", value)
+    assert c.get("a") == value # a is now more recent than b
+    c.put("d", value) # 120 bytes: evict down to 90, the least recently used first
+    assert c.get("b") is None
+    assert c.get("a") == value
+    assert c.get("d") == value
+    assert c._size <= 90
+    c.close()
+
+def test_eviction_drops_the_memory_copy(tmp_path):
+    c = make(tmp_path, max_bytes=100, memory_entries=10)
+    value = "x" * 28
+    for key in "abcd":
+        c.put(key, value)
+    assert c.get("a") is None
+    c.close()
+
+def test_readonly_serves_hits_without_storing(tmp_path):
+    c = make(tmp_path)
+    c.put("k", "v")
+    c.close()
+    c = make(tmp_path, mode="readonly")
+    assert c.get("k") == "v"
+    c.put("new", "v")
+    assert c.get("new") is None
+    c.close()
+
+def test_replay_raises_on_a_miss(tmp_path):
+    c = make(tmp_path)
+    c.put("k", "v")
+    c.close()
+    c = make(tmp_path, mode="replay")
+    assert c.get("k") == "v"
+    with pytest.raises(CacheMiss):
+        c.get("missing")
+    c.put("missing", "v")
+    with pytest.raises(CacheMiss):
+        c.get("missing")
+    c.close()
+
+def test_invalid_mode(tmp_path):
+    with pytest.raises(ValueError):
+        make(tmp_path, mode="write")
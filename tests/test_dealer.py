@@ -0,0 +1,82 @@
+from dealer import DealerContext
+from ratelimit import message_tokens
+
+def exchange(context, i, results=1, size=0):
+    context.add_response({"role": "assistant", "content": f"step {i}" + "x" * size, "tool_calls": [{"id": str(i)}]})
+    for j in range(results):
+        context.add_tool_result({"role": "tool", "tool_call_id": str(i), "content": f"result {i}.{j}"})
+
+def steps(messages):
+    return [m["content"].split()[1].rstrip("x") for m in messages if m["role"] == "assistant"]
+
+def test_everything_fits():
+    context = DealerContext("rules", "play", summary=lambda: "state")
+    for i in range(3):
+        exchange(context, i)
+    messages = context.messages()
+    assert [m["role"] for m in messages] == ["system", "user"] + ["assistant", "tool"] * 3
+    assert messages[1]["content"] == "play" # no summary while nothing was dropped
+    assert context.dropped == 0
+
+def test_window_keeps_the_latest_exchanges():
+    context = DealerContext("rules", "play", summary=lambda: "state", window=4)
+    for i in range(10):
+        exchange(context, i, results=2)
+    messages = context.messages()
+    assert steps(messages) == ["6", "7", "8", "9"]
+    assert context.dropped == 6
+    assert len(context) == 4
+
+def test_exchanges_are_never_split():
+    context = DealerContext("rules", "play", window=2)
+    for i in range(5):
+        exchange(context, i, results=3)
+    messages = context.messages()[2:]
+    assert messages[0]["role"] == "assistant"
+    # every tool result follows the assistant message that called it
+    call = None
+    for m in messages:
+        if m["role"] == "assistant":
+            call = m["tool_calls"][0]["id"]
+        else:
+            assert m["tool_call_id"] == call
+
+def test_max_tokens_trims_the_oldest_exchanges():
+    context = DealerContext("rules", "play", summary=lambda: "state", max_tokens=300)
+    for i in range(6):
+        exchange(context, i, size=300) # about 100 tokens each
+    messages = context.messages()
+    assert context.last_tokens <= 300
+    assert context.last_tokens == sum(message_tokens(m) for m in messages)
+    assert steps(messages) == ["4", "5"]
+    assert context.dropped == 4
+
+def test_latest_exchange_is_kept_even_if_too_large():
+    context = DealerContext("rules", "play", max_tokens=10)
+    exchange(context, 0)
+    exchange(context, 1, size=1000)
+    assert steps(context.messages()) == ["1"]
+
+def test_summary_is_sent_once_anything_was_dropped():
+    summaries = []
+    def summary():
+        summaries.append(len(summaries))
+        return f"state {len(summaries)}"
+    context = DealerContext("rules", "play", summary=summary, window=2)
+    exchange(context, 0)
+    exchange(context, 1)
+    assert context.messages()[1]["content"] == "play"
+    assert summaries == []
+    exchange(context, 2)
+    request = context.messages()[1]
+    assert request["role"] == "user"
+    assert request["content"].startswith("play\n\n") and request["content"].endswith("state 1")
+    # the summary is generated again for every call, from the current state
+    exchange(context, 3)
+    assert context.messages()[1]["content"].endswith("state 2")
+
+def test_no_summary_without_a_callback():
+    context = DealerContext("rules", "play", window=1)
+    exchange(context, 0)
+    exchange(context, 1)
+    assert context.messages()[1]["content"] == "play"
@@ -0,0 +1,48 @@
+from fractions import Fraction
+from itertools import combinations
+
+import pytest
+
+from odds import DECK, HAND_SIZE, HONEST_TABLE, honest_probability
+
+def deck():
+    return [card for card, count in DECK.items() for _ in range(count)]
+
+def remove(cards, removed):
+    cards = list(cards)
+    for card in removed:
+        cards.remove(card)
+    return cards
+
+def brute_force(k, table_card, seen):
+    """
+    Share of the k card subsets of the unseen cards that are all table cards or Jokers.
+    """
+    unseen = remove(deck(), seen)
+    subsets = list(combinations(unseen, k))
+    honest = sum(all(card in (table_card, "Joker") for card in subset) for subset in subsets)
+    return Fraction(honest, len(subsets))
+
+def hand_with(matching, table_card):
+    # matching cards from the table card and Jokers, the rest from the other ranks
+    matches = ([table_card] * DECK[table_card] + ["Joker"] * DECK["Joker"])[:matching]
+    others = [card for card in ("Q", "K", "A") if card != table_card]
+    rest = ([others[0]] * DECK[others[0]] + [others[1]] * DECK[others[1]])[:HAND_SIZE - matching]
+    return matches + rest
+
+@pytest.mark.parametrize("table_card", ["Q", "K", "A"])
+@pytest.mark.parametrize("matching", range(HAND_SIZE + 1))
+def test_table_matches_enumeration(table_card, matching):
+    hand = hand_with(matching, table_card)
+    for k in range(HAND_SIZE + 1):
+        assert HONEST_TABLE[matching][k] == pytest.approx(float(brute_force(k, table_card, hand)), abs=1e-12)
+        assert honest_probability(k, table_card, hand) == HONEST_TABLE[matching][k]
+
+def test_played_cards_count_as_seen():
+    hand = ["Q", "K", "K", "A"]
+    played = ["Joker"]
+    assert honest_probability(2, "Q", hand, played) == pytest.approx(float(brute_force(2, "Q", hand + played)))
+    assert honest_probability(2, "Q", hand, played) == HONEST_TABLE[2][2]
+
+def test_claim_of_zero_cards_is_always_honest():
+    assert all(row[0] == 1.0 for row in HONEST_TABLE)
@@ -0,0 +1,99 @@
+import pytest
+
+import ratelimit
+from ratelimit import RateLimit, RateLimiter, RateLimitExceeded, SharedTokenBucket, TokenBucket
+from retry import RetryPolicy, retry_call
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit.time, "time", clock)
+    return clock
+
+@pytest.fixture(params=["memory", "file"])
+def bucket(request, clock, tmp_path):
+    # 1 unit per second, up to 10
+    if request.param == "memory":
+        return TokenBucket(1.0, 10)
+    return SharedTokenBucket(1.0, 10, str(tmp_path / "bucket"))
+
+def test_full_bucket_does_not_wait(bucket):
+    assert bucket.reserve(10) == 0.0
+    assert bucket.reserve(2) == pytest.approx(2.0)
+
+def test_refill(bucket, clock):
+    bucket.reserve(10)
+    clock.now += 4
+    assert bucket.reserve(4) == 0.0
+    assert bucket.reserve(1) == pytest.approx(1.0)
+
+def test_refill_stops_at_capacity(bucket, clock):
+    clock.now += 100
+    assert bucket.reserve(10) == 0.0
+    assert bucket.reserve(1) == pytest.approx(1.0)
+
+def test_refund(bucket):
+    bucket.reserve(10)
+    bucket.reserve(-3)
+    assert bucket.reserve(3) == 0.0
+    assert bucket.reserve(1) == pytest.approx(1.0)
+
+def test_refund_does_not_overshoot_capacity(bucket, clock):
+    bucket.reserve(5)
+    clock.now += 5 # back to full
+    bucket.reserve(-5)
+    assert bucket.reserve(10) == 0.0
+    assert bucket.reserve(1) == pytest.approx(1.0)
+
+def test_shared_buckets_share_the_budget(clock, tmp_path):
+    path = str(tmp_path / "bucket")
+    a, b = SharedTokenBucket(1.0, 10, path), SharedTokenBucket(1.0, 10, path)
+    assert a.reserve(6) == 0.0
+    assert b.reserve(6) == pytest.approx(2.0)
+
+def test_invalid_limit():
+    with pytest.raises(ValueError):
+        RateLimit(requests_per_minute=0)
+
+def test_limiter_checks_provider_and_model(clock):
+    limiter = RateLimiter({"openrouter": {"requests_per_minute": 60}, "m": {"tokens_per_minute": 600}})
+    assert limiter.acquire("openrouter", "m", 600) == 0.0
+    assert limiter.acquire("openrouter", "other", 10) == 0.0
+    assert limiter.acquire("openrouter", "m", 60) == pytest.approx(6.0) # 10 tokens per second
+    assert limiter.throttled == 1
+    assert limiter.acquire("ollama", "x", 10**6) == 0.0 # no limit
+
+def test_settle(clock):
+    limiter = RateLimiter({"m": {"tokens_per_minute": 600}})
+    limiter.acquire("openrouter", "m", 600)
+    limiter.settle("openrouter", "m", -100) # used 100 tokens less than estimated
+    assert limiter.acquire("openrouter", "m", 100) == 0.0
+    limiter.settle("openrouter", "m", 50)
+    assert limiter.acquire("openrouter", "m", 10) == pytest.approx(6.0)
+
+def test_timeout_reserves_nothing(clock):
+    limiter = RateLimiter({"openrouter": {"requests_per_minute": 60}, "m": {"tokens_per_minute": 600}})
+    limiter.acquire("openrouter", "m", 600)
+    with pytest.raises(RateLimitExceeded):
+        limiter.acquire("openrouter", "m", 60, timeout=1.0)
+    clock.now += 1 # one request and 10 tokens back, as nothing was kept
+    assert limiter.acquire("openrouter", "m", 10) == 0.0
+
+def test_rate_limit_exceeded_is_not_retried(clock, monkeypatch):
+    monkeypatch.setattr("retry.time.sleep", lambda delay: None)
+    limiter = RateLimiter({"m": {"requests_per_minute": 1}})
+    limiter.acquire("openrouter", "m", 0)
+    calls = []
+    def fn(timeout):
+        calls.append(timeout)
+        limiter.acquire("openrouter", "m", 0, timeout=1.0)
+    with pytest.raises(RateLimitExceeded):
+        retry_call(fn, RetryPolicy(attempts=4))
+    assert len(calls) == 1
@@ -0,0 +1,114 @@
+import asyncio
+import time
+
+import pytest
+
+import retry
+from retry import RetryPolicy, aretry_call, repair_json, retry_after, retry_call
+
+class APIError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(status_code)
+        self.status_code = status_code
+        self.response = type("Response", (), {"headers": headers or {}})()
+
+class APITimeoutError(Exception):
+    pass
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"a": 1}', {"a": 1}),
+    ('```json\n{"a": 1}\n```', {"a": 1}),
+    ('```\n{"a": [1, 2]}\n```', {"a": [1, 2]}),
+    ('Sure! Here is my move: {"a": 1} Good luck.', {"a": 1}),
+    ('{"a": [1, 2,], "b": {"c": 3,},}', {"a": [1, 2], "b": {"c": 3}}),
+    ("{'a': True, 'b': None}", {"a": True, "b": None}),
+    ('{"cards": ["Q", "Joker"], "reason": "a {brace} inside"}', {"cards": ["Q", "Joker"], "reason": "a {brace} inside"}),
+])
+def test_repair_json(text, expected):
+    assert repair_json(text) == expected
+
+@pytest.mark.parametrize("text", [None, "", "no json here", "[1, 2]", '"text"', "{not: valid", "} {", "{'a': f(1)}"])
+def test_repair_json_gives_up(text):
+    assert repair_json(text) is None
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    waited = []
+    monkeypatch.setattr(retry.time, "sleep", waited.append)
+    return waited
+
+def failing(errors, result="ok"):
+    calls = []
+    def fn(timeout):
+        calls.append(timeout)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+    return fn, calls
+
+def test_retries_transient_errors(sleeps):
+    fn, calls = failing([APIError(429), APIError(503), APITimeoutError()])
+    retries = []
+    assert retry_call(fn, RetryPolicy(attempts=4), on_retry=lambda attempt, e, delay: retries.append(attempt)) == "ok"
+    assert len(calls) == 4
+    assert retries == [0, 1, 2]
+    assert len(sleeps) == 3
+
+def test_gives_up_after_the_attempts(sleeps):
+    fn, calls = failing([APIError(500)] * 5)
+    with pytest.raises(APIError):
+        retry_call(fn, RetryPolicy(attempts=3))
+    assert len(calls) == 3
+
+@pytest.mark.parametrize("error", [APIError(400), APIError(401), ValueError("bad")])
+def test_does_not_retry_permanent_errors(sleeps, error):
+    fn, calls = failing([error])
+    with pytest.raises(type(error)):
+        retry_call(fn, RetryPolicy(attempts=4))
+    assert len(calls) == 1
+    assert sleeps == []
+
+def test_retry_after_is_honored(sleeps):
+    fn, calls = failing([APIError(429, {"retry-after": "2"})])
+    retry_call(fn, RetryPolicy(attempts=2))
+    assert sleeps == [2.0]
+
+def test_gives_up_when_the_wait_would_pass_the_deadline(sleeps):
+    fn, calls = failing([APIError(429, {"retry-after": "5"})])
+    with pytest.raises(APIError):
+        retry_call(fn, RetryPolicy(attempts=4), deadline=time.monotonic() + 1)
+    assert len(calls) == 1
+    assert sleeps == []
+
+def test_timeout_is_the_time_left(sleeps):
+    fn, calls = failing([])
+    retry_call(fn, RetryPolicy(), deadline=time.monotonic() + 10)
+    assert 9 < calls[0] <= 10
+    fn, calls = failing([])
+    retry_call(fn, RetryPolicy())
+    assert calls == [None]
+
+def test_backoff_is_bounded():
+    policy = RetryPolicy(base_delay=0.5, max_delay=2.0)
+    for attempt in range(10):
+        assert 0 <= policy.backoff(attempt) <= min(2.0, 0.5 * 2 ** attempt)
+    assert policy.backoff(3, retry_after=7) == 7
+
+def test_retry_after_headers():
+    assert retry_after(APIError(429, {"retry-after-ms": "250"})) == 0.25
+    assert retry_after(APIError(429, {"retry-after": "3"})) == 3.0
+    assert retry_after(APIError(429, {"retry-after": "Thu, 01 Jan 1970 00:00:00 GMT"})) == 0.0
+    assert retry_after(APIError(429, {"retry-after": "soon"})) is None
+    assert retry_after(APIError(429)) is None
+    assert retry_after(ValueError()) is None
+
+def test_async_retries(monkeypatch):
+    waited = []
+    async def sleep(delay):
+        waited.append(delay)
+    monkeypatch.setattr(retry.asyncio, "sleep", sleep)
+    fn, calls = failing([APIError(502)])
+    async def afn(timeout):
+        return fn(timeout)
+    assert asyncio.run(aretry_call(afn, RetryPolicy(attempts=2))) == "ok"
+    assert len(calls) == 2 and len(waited) == 1
@@ -0,0 +1,93 @@
+import random
+from itertools import product
+
+import pytest
+
+from state import (CARD_TYPES, GameState, Hand, PlayerState, decode_move, encode_move, legal_plays)
+
+DECK = ["Q"] * 6 + ["K"] * 6 + ["A"] * 6 + ["Joker"] * 2
+
+def test_counts_do_not_overflow_into_the_next_card():
+    # every count the deck allows, including 6 of a kind next to the others
+    for counts in product(range(7), range(7), range(7), range(3)):
+        hand = Hand.from_counts(counts)
+        assert hand.counts() == counts
+        assert Hand.from_cards(hand.cards()) == hand
+        assert len(hand) == sum(counts)
+
+def test_from_cards_matches_the_card_counts():
+    rng = random.Random(0)
+    for _ in range(200):
+        cards = rng.sample(DECK, rng.randint(0, 10))
+        hand = Hand.from_cards(cards)
+        assert hand.cards() == sorted(cards)
+        assert all(hand.count(card) == cards.count(card) for card in CARD_TYPES)
+        assert hand.matching("K") == cards.count("K") + cards.count("Joker")
+
+def test_contains_and_remove():
+    rng = random.Random(1)
+    for _ in range(200):
+        cards = rng.sample(DECK, 5)
+        other = rng.sample(DECK, rng.randint(1, 3))
+        hand, play = Hand.from_cards(cards), Hand.from_cards(other)
+        remaining = list(cards)
+        fits = True
+        for card in other:
+            if card in remaining:
+                remaining.remove(card)
+            else:
+                fits = False
+        assert hand.contains(play) == fits
+        if fits:
+            assert hand.remove(play) == Hand.from_cards(remaining)
+            assert hand.remove(play).add(play) == hand
+        else:
+            with pytest.raises(ValueError):
+                hand.remove(play)
+
+def test_legal_plays():
+    plays = legal_plays(["Q", "Q", "Joker", "A", "Q"])
+    assert plays[0] == ["A"]
+    assert ["Q", "Q", "Q"] in plays and ["A", "Joker", "Q"] in plays
+    assert ["A", "A"] not in plays
+    assert len(plays) == len({tuple(play) for play in plays})
+    assert all(1 <= len(play) <= 3 for play in plays)
+
+def test_move_codes():
+    assert encode_move([]) == "C"
+    assert encode_move(["Q", "Joker"]) == "QJ"
+    for cards in ([], ["Q"], ["A", "Joker", "K"]):
+        assert decode_move(encode_move(cards)) == cards
+
+def random_state(rng):
+    n = rng.randint(2, 4)
+    deck = list(DECK)
+    rng.shuffle(deck)
+    players = [PlayerState(Hand.from_cards(deck[5 * i:5 * i + 5]), Hand.from_cards(rng.sample(DECK, rng.randint(0, 3))),
+                           rng.randint(0, 3), rng.randint(0, 3), rng.random() < 0.7) for i in range(n)]
+    last = rng.choice([None] + list(range(n)))
+    return GameState(players, rng.sample(range(n), rng.randint(0, n)), rng.choice((None, "Q", "K", "A")),
+                     rng.randint(0, 60000), last, Hand.from_cards(rng.sample(DECK, 3)) if last is not None else None)
+
+def test_game_state_round_trip():
+    rng = random.Random(2)
+    for _ in range(500):
+        state = random_state(rng)
+        data = state.to_bytes()
+        restored = GameState.from_bytes(data)
+        assert restored == state
+        assert restored.key() == state.key()
+        assert restored.to_bytes() == data
+
+def test_empty_game_state_round_trip():
+    state = GameState([PlayerState()])
+    restored = GameState.from_bytes(state.to_bytes())
+    assert restored == state
+    assert restored.table_card is None and restored.last_player is None and restored.order == ()
+
+def test_copy_is_independent():
+    state = random_state(random.Random(3))
+    copy = state.copy()
+    assert copy == state and hash(copy) == hash(state)
+    copy.players[0].alive = not copy.players[0].alive
+    assert copy != state
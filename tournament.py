@@ -0,0 +1,101 @@
+# Copyright (c) 2025 Kevin Lin
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import os
+import json
+import time
+import argparse
+import tempfile
+import multiprocessing
+from collections import Counter
+
+import bm
+from log import log_start
+
+'''
+Headless tournament runner.
+Plays many independent GameProg games across a process pool. Every worker loads
+the configuration once and then plays games back to back, so the per-game cost
+is only the game itself. Each game gets its own seed derived from the base seed
+and the game index, so a tournament is reproducible no matter which worker ends
+up playing which game.
+Rate limits from the configuration are shared by all workers: unless the
+configuration names a "rate_limit_dir", the buckets live in a temporary
+directory for the length of the tournament.
+'''
+
+_CONFIG = None
+
+def _init_worker(config_file, logdir, cache_file=None, cache_mode="readwrite", rate_limit_dir=None):
+    global _CONFIG
+    _CONFIG = bm.load_config(config_file)
+    if "rate_limits" in _CONFIG and "rate_limit_dir" not in _CONFIG:
+        bm.set_rate_limiter(bm.RateLimiter(_CONFIG["rate_limits"], rate_limit_dir))
+    if cache_file:
+        from cache import ResponseCache
+        bm.set_response_cache(ResponseCache(cache_file, mode=cache_mode))
+    bm.RANDOM_THINK_TIME = 0  # no pacing needed without a screen
+    if logdir:
+        log_start(os.path.join(logdir, f"worker-{os.getpid()}.log"))
+    else:
+        log_start(os.devnull)
+
+def play_game(task):
+    """
+    Play one game in a worker process and return its result.
+    """
+    game_index, seed = task
+    bm.METRICS.clear() # games run one after another here, so each report() covers only its own game
+    game = bm.GameProg(bm.make_players(_CONFIG), seed=seed)
+    start = time.perf_counter()
+    game.play()
+    game.report()
+    result = game.result()
+    result["game"] = game_index
+    result["seconds"] = round(time.perf_counter() - start, 4)
+    result["worker"] = os.getpid()
+    return result
+
+def run_tournament(config_file, games, out_file, processes=None, seed=0, logdir=None, cache_file=None, cache_mode="readwrite"):
+    """
+    Play `games` games over `processes` workers (all cores by default) and stream
+    one JSON line per finished game into out_file. Returns the win counts.
+    """
+    if logdir:
+        os.makedirs(logdir, exist_ok=True)
+    processes = processes or os.cpu_count()
+    tasks = ((i, seed + i) for i in range(games))
+    chunksize = max(1, games // (processes * 8))
+    wins = Counter()
+
+    with tempfile.TemporaryDirectory(prefix="bluff_mind_rate_") as rate_limit_dir, \
+            multiprocessing.Pool(processes, initializer=_init_worker,
+                                 initargs=(config_file, logdir, cache_file, cache_mode, rate_limit_dir)) as pool, \
+            open(out_file, "w", encoding="utf-8") as f:
+        for result in pool.imap_unordered(play_game, tasks, chunksize=chunksize):
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+            f.flush()
+            wins[result["winner"]] += 1
+    return wins
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="BluffMind tournament")
+    parser.add_argument('-n', '--games', type=int, default=100, help='Number of games to play')
+    parser.add_argument('-p', '--processes', type=int, default=None, help='Number of worker processes (default: all cores)')
+    parser.add_argument('-s', '--seed', type=int, default=0, help='Base seed, game i is played with seed + i')
+    parser.add_argument('-c', '--config', type=str, default='config.json', help='Configuration file for players')
+    parser.add_argument('-o', '--output', type=str, default='tournament.jsonl', help='Results file, one JSON line per game')
+    parser.add_argument('-l', '--logdir', type=str, default=None, help='Directory for per-worker log files (default: no logs)')
+    parser.add_argument('--cache', type=str, default=None, help='Cache LLM responses in this file, shared by all workers')
+    parser.add_argument('--cache_mode', type=str, default='readwrite', choices=['readwrite', 'readonly', 'replay'], help='Response cache mode')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    wins = run_tournament(args.config, args.games, args.output, args.processes, args.seed, args.logdir, args.cache, args.cache_mode)
+    elapsed = time.perf_counter() - start
+
+    print(f"Played {args.games} games in {elapsed:.1f}s ({args.games / elapsed:.1f} games/s)")
+    for name, count in wins.most_common():
+        print(f"{name}: {count} wins ({100 * count / args.games:.1f}%)")
@@ -3,46 +3,366 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
-import soundfile as sf
-import subprocess   
+import subprocess
 import platform
 import threading
-from playsound import playsound
-from kokoro import KPipeline
+import os
+import time
+import queue
+import hashlib
+from collections import OrderedDict, deque
+import numpy as np
 
-class VoiceTTS:
-    def __init__(self, voice_file="audio.wav", model_id='prince-canuma/Kokoro-82M', lang='a'):
-        self.pipeline = KPipeline(lang_code='a')  
+from metrics import observe
+from profiler import phase
+
+SAMPLE_RATE = 24000 # Kokoro output rate
+AUDIO_SINKS = ["stream", "playsound", "file", "null"]
+
+class RingBuffer:
+    '''
+    Fixed size ring buffer of float32 samples shared by one writer and one reader.
+    write() blocks while the buffer is full; read_into() never blocks and pads
+    with silence, as an audio callback must.
+    '''
+    def __init__(self, size=SAMPLE_RATE * 4):
+        self.buffer = np.zeros(size, dtype=np.float32)
+        self.size = size
+        self.start = 0
+        self.count = 0
+        self.cond = threading.Condition()
+
+    def write(self, samples):
+        samples = np.asarray(samples, dtype=np.float32).reshape(-1) # a view of Kokoro's tensor, not a copy
+        while len(samples) > 0:
+            with self.cond:
+                while self.count == self.size:
+                    self.cond.wait()
+                n = min(len(samples), self.size - self.count)
+                end = (self.start + self.count) % self.size
+                first = min(n, self.size - end)
+                self.buffer[end:end + first] = samples[:first]
+                self.buffer[:n - first] = samples[first:n]
+                self.count += n
+                self.cond.notify_all()
+            samples = samples[n:]
+
+    def read_into(self, out):
+        with self.cond:
+            n = min(len(out), self.count)
+            first = min(n, self.size - self.start)
+            out[:first] = self.buffer[self.start:self.start + first]
+            out[first:n] = self.buffer[:n - first]
+            out[n:] = 0
+            self.start = (self.start + n) % self.size
+            self.count -= n
+            self.cond.notify_all()
+        return n
+
+    def wait_empty(self):
+        with self.cond:
+            while self.count > 0:
+                self.cond.wait()
+
+class StreamSink:
+    '''
+    Plays samples through one persistent output stream fed from a ring buffer.
+    '''
+    def __init__(self, buffer_seconds=4):
+        import sounddevice as sd
+        self.ring = RingBuffer(int(SAMPLE_RATE * buffer_seconds))
+        self.stream = sd.OutputStream(samplerate=SAMPLE_RATE, channels=1, dtype="float32", callback=self._callback)
+        self.stream.start()
+
+    def _callback(self, outdata, frames, time_info, status):
+        self.ring.read_into(outdata[:, 0])
+
+    def write(self, samples):
+        self.ring.write(samples)
+
+    def wait(self):
+        self.ring.wait_empty()
+        time.sleep(self.stream.latency) # let the device play out what it already has
+
+    def close(self):
+        self.stream.stop()
+        self.stream.close()
+
+class PlaysoundSink:
+    '''
+    Writes each chunk to a wav file and plays it with playsound, one at a time.
+    Used when no output stream can be opened.
+    '''
+    def __init__(self, voice_file="audio.wav"):
+        self.voice_file = voice_file
         self.process = None
+
+    def write(self, samples):
+        import soundfile as sf
+        from playsound import playsound
+        if self.process is not None:
+            self.process.join()
+        sf.write(self.voice_file, samples, SAMPLE_RATE)
+        self.process = threading.Thread(target=playsound, args=[self.voice_file])
+        self.process.start()
+
+    def wait(self):
+        if self.process is not None:
+            self.process.join()
+            self.process = None
+
+    def close(self):
+        self.wait()
+
+class FileSink:
+    '''
+    Appends all samples to one wav file instead of playing them.
+    '''
+    def __init__(self, path="audio.wav"):
+        import soundfile as sf
+        self.file = sf.SoundFile(path, mode="w", samplerate=SAMPLE_RATE, channels=1, subtype="FLOAT")
+        self.lock = threading.Lock()
+
+    def write(self, samples):
+        with self.lock:
+            self.file.write(np.asarray(samples, dtype=np.float32).reshape(-1))
+
+    def wait(self):
+        with self.lock:
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+class NullSink:
+    '''
+    Discards samples. With realtime=True it still takes as long as playing them
+    would, to keep show mode timing on headless machines.
+    '''
+    def __init__(self, realtime=False):
+        self.realtime = realtime
+        self.busy_until = 0.0
+
+    def write(self, samples):
+        if self.realtime:
+            start = max(time.monotonic(), self.busy_until)
+            self.busy_until = start + len(samples) / SAMPLE_RATE
+
+    def wait(self):
+        delay = self.busy_until - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def close(self):
+        pass
+
+def make_sink(sink="stream", voice_file="audio.wav"):
+    if sink == "stream":
+        try:
+            return StreamSink()
+        except (ImportError, OSError):
+            # sounddevice or PortAudio is not available, fall back to playing files
+            return PlaysoundSink(voice_file)
+    elif sink == "playsound":
+        return PlaysoundSink(voice_file)
+    elif sink == "file":
+        return FileSink(voice_file)
+    elif sink == "null":
+        return NullSink()
+    raise ValueError(f"Invalid audio sink: {sink}. Supported sinks are: {', '.join(AUDIO_SINKS)}.")
+
+class PhraseCache:
+    '''
+    Synthesized audio keyed by (voice, text, speed, lang): an in-memory LRU bounded
+    in bytes, optionally backed by .npy files in cache_dir that outlive the process.
+    '''
+    def __init__(self, max_bytes=64 * 1024 * 1024, cache_dir=None):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(voice, text, speed, lang):
+        return hashlib.sha1(f"{voice}\0{text}\0{speed}\0{lang}".encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".npy")
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+        if self.cache_dir and os.path.exists(self._path(key)):
+            audio = np.load(self._path(key))
+            self._remember(key, audio)
+            return audio
+        return None
+
+    def put(self, key, audio):
+        self._remember(key, audio)
+        if self.cache_dir:
+            np.save(self._path(key), audio)
+
+    def _remember(self, key, audio):
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries[key].nbytes
+            self.entries[key] = audio
+            self.entries.move_to_end(key)
+            self.size += audio.nbytes
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                _, old = self.entries.popitem(last=False)
+                self.size -= old.nbytes
+
+    def __contains__(self, key):
+        return key in self.entries or bool(self.cache_dir and os.path.exists(self._path(key)))
+
+_WAKE = ("wake",) # queued to wake the worker up for warmup lines
+
+class VoiceTTS:
+    '''
+    Speech is produced by one worker thread. voice_say only queues the line and
+    returns; the worker synthesizes it, or takes it from the cache, and writes it
+    to the sink, synthesizing the next line while the previous one still plays.
+    Warmup lines are synthesized when there is nothing to say. The Kokoro model
+    itself is loaded by the worker too, so creating a VoiceTTS returns at once.
+    '''
+    def __init__(self, voice_file="audio.wav", model_id='prince-canuma/Kokoro-82M', lang='a', sink="stream",
+                 cache_bytes=64 * 1024 * 1024, cache_dir=None, queue_size=16):
+        self.lang = lang
+        self.pipeline = None
+        self.ready = threading.Event() # set once the model is loaded
         self.voice_file = voice_file
+        self.sink = make_sink(sink, voice_file) if isinstance(sink, str) else sink
+        self.cache = PhraseCache(cache_bytes, cache_dir)
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.warmup_lines = deque()
+        self.worker = threading.Thread(target=self._run, name="tts", daemon=True)
+        self.worker.start()
+
+    def _run(self):
+        try:
+            with phase("tts_load"):
+                from kokoro import KPipeline
+                self.pipeline = KPipeline(lang_code=self.lang)
+        except Exception as e:
+            print(f"TTS model failed to load: {e}")
+        finally:
+            self.ready.set()
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                if self.warmup_lines:
+                    self._warm(*self.warmup_lines.popleft())
+                    continue
+                item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                if item is not _WAKE:
+                    playback = None
+                    for audio in self._chunks(*item):
+                        start = time.perf_counter()
+                        with phase("audio_play"):
+                            self.sink.write(audio) # blocks while the sink is full, i.e. while the line plays
+                        playback = (playback or 0.0) + time.perf_counter() - start
+                    if playback is not None:
+                        observe("tts_playback_seconds", playback, voice=item[0])
+            except Exception as e:
+                print(f"TTS error: {e}")
+            finally:
+                self.queue.task_done()
+
+    def _warm(self, speaker, text, speed):
+        if self.pipeline is None:
+            return # the model failed to load, already reported once
+        if PhraseCache.key(speaker, text, speed, self.lang) not in self.cache:
+            try:
+                for _ in self._chunks(speaker, text, speed, record=False):
+                    pass
+            except Exception as e:
+                print(f"TTS warmup error: {e}")
+
+    def _chunks(self, speaker, text, speed, record=True):
+        """
+        Yield the audio for text, from the cache if possible. A line that is not
+        cached yet is yielded chunk by chunk as it is synthesized, then cached,
+        or not at all if the model failed to load. record=False keeps the
+        synthesis time out of the metrics, for lines synthesized ahead of time.
+        """
+        key = PhraseCache.key(speaker, text, speed, self.lang)
+        audio = self.cache.get(key)
+        if audio is not None:
+            yield audio
+            return
+        if self.pipeline is None:
+            return
+        chunks = []
+        synthesis = 0.0 # time spent in Kokoro, not in the consumer of the chunks
+        results = iter(self.pipeline(text, voice=speaker, speed=speed))
+        while True:
+            start = time.perf_counter()
+            with phase("tts_synth"):
+                result = next(results, None)
+            synthesis += time.perf_counter() - start
+            if result is None:
+                break
+            audio = np.asarray(result[2], dtype=np.float32).reshape(-1)
+            chunks.append(audio)
+            yield audio
+        if record:
+            observe("tts_synthesis_seconds", synthesis, voice=speaker)
+        if chunks:
+            self.cache.put(key, np.concatenate(chunks))
 
     def voice_say(self, speaker, text, speed=1.0):
         # remove * from the text
         text = text.replace("*", "")
-        for _, _, audio in self.pipeline(text, voice=speaker, speed=speed):
-            if self.process is not None:
-                self.process.join()
-            sf.write(self.voice_file, audio, 24000)
-            self.process = threading.Thread(target=playsound, args=[self.voice_file])
-            self.process.start()
+        self.queue.put((speaker, text, speed)) # blocks only when the queue is full
+
+    def warmup(self, lines):
+        """
+        Queue (voice, text, speed) lines to be synthesized into the cache, without
+        playing them, whenever the worker has nothing to say.
+        """
+        self.warmup_lines.extend((speaker, text.replace("*", ""), speed) for speaker, text, speed in lines)
+        self.queue.put(_WAKE)
 
     def wait(self):
-        if self.process is not None:
-            self.process.join()
-            self.process = None
+        """
+        Wait until everything queued so far has been said.
+        """
+        self.queue.join()
+        self.sink.wait()
+
+    def close(self):
+        self.warmup_lines.clear()
+        self.queue.put(None)
+        self.worker.join()
+        self.sink.close()
 
 
 if __name__ == "__main__":
     import argparse
-    
+
     parser = argparse.ArgumentParser(description="Test the Voice TTS system.")
     parser.add_argument("--voice", type=str, default="af_heart", help="Voice to use for TTS.")
     parser.add_argument("--text", type=str, default="Hello, this is a test of the voice TTS system.", help="Text to say.")
     parser.add_argument("--speed", type=float, default=1.0, help="Speed of the speech.")
     parser.add_argument("--lang", type=str, default="a", help="a for English, z for Chinese.")
-    args = parser.parse_args()  
-    tts = VoiceTTS(lang=args.lang)
+    parser.add_argument("--sink", type=str, default="stream", choices=AUDIO_SINKS, help="Where the audio goes.")
+    args = parser.parse_args()
+    tts = VoiceTTS(lang=args.lang, sink=args.sink)
     tts.voice_say(args.voice, args.text, speed=args.speed)
     print("TTS started. Press Ctrl+C to stop.")
     tts.wait()
-    print("TTS completed.")
\ No newline at end of file
+    tts.close()
+    print("TTS completed.")
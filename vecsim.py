@@ -0,0 +1,234 @@
+# Copyright (c) 2025 Kevin Lin
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import time
+import argparse
+import numpy as np
+
+'''
+Vectorized Liar's Deck simulator.
+Plays many games at once as NumPy arrays, with the same rules as GameProg:
+- every round the 20 card deck (2 Jokers, 6 Q, 6 K, 6 A) is shuffled and the
+  alive players, in player order, are dealt 5 consecutive cards each, as in
+  BaseGame.shuffle_cards,
+- the table card is Q, K or A at random and the alive players are reseated in
+  a random order, as in BaseGame.round_order,
+- a challenge succeeds if any claimed card is neither the table card nor a
+  Joker, as in BaseGame.check_cards, and the loser fires their revolver,
+- revolvers have 3 chambers with the bullet at a random position set once per
+  game and fire in order, as in Player.reset_rr and Player.shoot_rr.
+
+Player policies have two parameters:
+- aggro (0-100): the chance of challenging the last player, as in
+  Player._play_card_random. A player with no cards left always challenges.
+- bluff (0-1): the chance of playing 1 to 3 random cards from the whole hand,
+  as in Player._play_card_random. Otherwise the player plays 1 to 3 of their
+  table cards and Jokers, and only bluffs if they have none.
+aggro=a, bluff=1 is exactly the "Random" player with aggression a.
+
+Cards are counted by type, in the order Q, K, A, Joker.
+'''
+
+CARD_TYPES = ['Q', 'K', 'A', 'Joker']
+JOKER = 3
+DECK = np.array([JOKER] * 2 + [0] * 6 + [1] * 6 + [2] * 6, dtype=np.int8)
+PLAYERS = 4
+HAND_SIZE = 5
+
+def _draw(rng, counts, n):
+    """
+    Draw n[i] cards without replacement from each row of type counts.
+    Returns the drawn type counts.
+    """
+    counts = counts.astype(np.int16)
+    drawn = np.zeros_like(counts)
+    rows = np.arange(len(counts))
+    for j in range(3):
+        active = rows[j < n]
+        if len(active) == 0:
+            break
+        c = counts[active]
+        u = rng.random(len(active)) * c.sum(1)
+        pick = np.minimum((u[:, None] >= c.cumsum(1)).sum(1), len(CARD_TYPES) - 1)
+        counts[active, pick] -= 1
+        drawn[active, pick] += 1
+    return drawn
+
+class VecSim:
+    def __init__(self, n_games, aggro=50, bluff=1.0, seed=None):
+        """
+        aggro and bluff are scalars, one value per player (shape (4,)), or one
+        value per game and player (shape (n_games, 4)).
+        """
+        self.n = n_games
+        self.rng = np.random.default_rng(seed)
+        self.aggro = np.broadcast_to(np.asarray(aggro, dtype=np.float64) / 100, (n_games, PLAYERS)).copy()
+        self.bluff = np.broadcast_to(np.asarray(bluff, dtype=np.float64), (n_games, PLAYERS)).copy()
+
+        self.alive = np.ones((n_games, PLAYERS), dtype=bool)
+        self.rr_position = self.rng.integers(1, 4, (n_games, PLAYERS), dtype=np.int8)
+        self.rr_played = np.zeros((n_games, PLAYERS), dtype=np.int8)
+        self.hands = np.zeros((n_games, PLAYERS, len(CARD_TYPES)), dtype=np.int8)
+        self.order = np.zeros((n_games, PLAYERS), dtype=np.int8)
+        self.n_alive = np.full(n_games, PLAYERS, dtype=np.int8)
+        self.seat = np.zeros(n_games, dtype=np.int8)
+        self.last = np.full(n_games, -1, dtype=np.int8)
+        self.claim = np.zeros((n_games, len(CARD_TYPES)), dtype=np.int8)
+        self.table = np.zeros(n_games, dtype=np.int8)
+
+        self.done = np.zeros(n_games, dtype=bool)
+        self.winner = np.full(n_games, -1, dtype=np.int8)
+        self.rounds = np.zeros(n_games, dtype=np.int16)
+        self.kill_order = np.full((n_games, PLAYERS - 1), -1, dtype=np.int8)
+        self.kills = np.zeros(n_games, dtype=np.int8)
+
+        self._new_round(np.arange(n_games))
+
+    def _new_round(self, games):
+        m = len(games)
+        if m == 0:
+            return
+        rng = self.rng
+        alive = self.alive[games]
+        self.rounds[games] += 1
+
+        # random seating of the alive players
+        keys = rng.random((m, PLAYERS))
+        keys[~alive] = 2.0
+        self.order[games] = np.argsort(keys, axis=1)
+        self.n_alive[games] = alive.sum(1)
+
+        # shuffle the deck, alive players in player order get 5 consecutive cards
+        deck = DECK[np.argsort(rng.random((m, len(DECK))), axis=1)].reshape(m, PLAYERS, HAND_SIZE, 1)
+        slots = np.zeros((m, PLAYERS, len(CARD_TYPES)), dtype=np.int8)
+        for k in range(HAND_SIZE):
+            slots += deck[:, :, k] == np.arange(len(CARD_TYPES))
+        rank = np.cumsum(alive, axis=1) - 1
+        hands = np.take_along_axis(slots, np.maximum(rank, 0)[:, :, None], axis=1)
+        hands[~alive] = 0
+        self.hands[games] = hands
+
+        self.table[games] = rng.integers(0, 3, m)
+        self.seat[games] = 0
+        self.last[games] = -1
+        self.claim[games] = 0
+
+    def step(self):
+        """
+        Play one turn in every unfinished game.
+        Per player values are gathered with flat game * PLAYERS + player indices.
+        """
+        rng = self.rng
+        games = np.flatnonzero(~self.done)
+        cur = np.take(self.order.reshape(-1), games * PLAYERS + self.seat[games])
+        slot = games * PLAYERS + cur
+        hand = np.take(self.hands.reshape(-1, len(CARD_TYPES)), slot, axis=0)
+        size = hand.sum(1)
+        challenge = (np.take(self.last, games) >= 0) & ((size == 0) | (rng.random(len(games)) < np.take(self.aggro.reshape(-1), slot)))
+
+        # plays
+        play = ~challenge
+        pg, ps, ph = games[play], slot[play], hand[play]
+        matching = ph.copy()
+        not_table = np.ones((len(pg), len(CARD_TYPES)), dtype=bool)
+        not_table[np.arange(len(pg)), self.table[pg]] = False
+        not_table[:, JOKER] = False
+        matching[not_table] = 0
+        bluffing = (rng.random(len(pg)) < np.take(self.bluff.reshape(-1), ps)) | (matching.sum(1) == 0)
+        pool = np.where(bluffing[:, None], ph, matching)
+        n = 1 + (rng.random(len(pg)) * np.minimum(3, pool.sum(1))).astype(np.int8)
+        drawn = _draw(rng, pool, n).astype(np.int8)
+        self.hands.reshape(-1, len(CARD_TYPES))[ps] = ph - drawn
+        self.claim[pg] = drawn
+        self.last[pg] = cur[play]
+        self.seat[pg] = (self.seat[pg] + 1) % self.n_alive[pg]
+
+        # challenges
+        cg, cc = games[challenge], cur[challenge]
+        claim = self.claim[cg]
+        rows = np.arange(len(cg))
+        honest = (claim.sum(1) - claim[rows, self.table[cg]] - claim[:, JOKER]) == 0
+        loser = cg * PLAYERS + np.where(honest, cc, self.last[cg])
+        rr_played = self.rr_played.reshape(-1)
+        rr_played[loser] += 1
+        killed = rr_played[loser] == np.take(self.rr_position.reshape(-1), loser)
+        kg, kl = cg[killed], loser[killed] - cg[killed] * PLAYERS
+        self.alive[kg, kl] = False
+        self.kill_order[kg, self.kills[kg]] = kl
+        self.kills[kg] += 1
+
+        finished = self.alive[cg].sum(1) == 1
+        fg = cg[finished]
+        self.done[fg] = True
+        self.winner[fg] = np.argmax(self.alive[fg], axis=1)
+        self._new_round(cg[~finished])
+
+    def run(self):
+        while not self.done.all():
+            self.step()
+        return {"winner": self.winner, "rounds": self.rounds, "kill_order": self.kill_order, "rr_shots": self.rr_played}
+
+def simulate(n_games, aggro=50, bluff=1.0, seed=None, batch_size=200000):
+    """
+    Play n_games games in batches and return the concatenated results.
+    aggro and bluff can be given per game, as in VecSim.
+    """
+    rng = np.random.default_rng(seed)
+    aggro = np.broadcast_to(np.asarray(aggro, dtype=np.float64), (n_games, PLAYERS))
+    bluff = np.broadcast_to(np.asarray(bluff, dtype=np.float64), (n_games, PLAYERS))
+    results = []
+    for start in range(0, n_games, batch_size):
+        end = min(start + batch_size, n_games)
+        sim = VecSim(end - start, aggro[start:end], bluff[start:end], seed=rng.integers(2**63))
+        results.append(sim.run())
+    return {k: np.concatenate([r[k] for r in results]) for k in results[0]}
+
+def sweep(aggro_values, bluff_values, games_per_cell=10000, opponent_aggro=50, opponent_bluff=1.0, seed=None):
+    """
+    Win rate of player 0 for every (aggro, bluff) pair against three fixed opponents.
+    Returns an array of shape (len(aggro_values), len(bluff_values)).
+    """
+    cells = [(a, b) for a in aggro_values for b in bluff_values]
+    n = len(cells) * games_per_cell
+    aggro = np.full((n, PLAYERS), opponent_aggro, dtype=np.float64)
+    bluff = np.full((n, PLAYERS), opponent_bluff, dtype=np.float64)
+    aggro[:, 0] = np.repeat([a for a, _ in cells], games_per_cell)
+    bluff[:, 0] = np.repeat([b for _, b in cells], games_per_cell)
+    winner = simulate(n, aggro, bluff, seed=seed)["winner"]
+    wins = (winner == 0).reshape(len(cells), games_per_cell).mean(1)
+    return wins.reshape(len(aggro_values), len(bluff_values))
+
+def _floats(text):
+    return [float(x) for x in text.split(",")]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vectorized BluffMind simulator")
+    parser.add_argument('-n', '--games', type=int, default=1000000, help='Number of games (per cell with --sweep)')
+    parser.add_argument('--aggro', type=str, default='50,50,50,50', help='Aggro level per player, 0-100')
+    parser.add_argument('--bluff', type=str, default='1,1,1,1', help='Bluff probability per player, 0-1')
+    parser.add_argument('--sweep', action='store_true', help='Sweep player 0 over aggro and bluff against other players at the last --aggro and --bluff values')
+    parser.add_argument('-s', '--seed', type=int, default=None, help='Random seed')
+    args = parser.parse_args()
+
+    aggro, bluff = _floats(args.aggro), _floats(args.bluff)
+    start = time.perf_counter()
+    if args.sweep:
+        aggro_values = list(range(0, 101, 10))
+        bluff_values = [0.0, 0.25, 0.5, 0.75, 1.0]
+        surface = sweep(aggro_values, bluff_values, args.games, aggro[-1], bluff[-1], seed=args.seed)
+        elapsed = time.perf_counter() - start
+        print("Win rate of player 0 (rows: aggro, columns: bluff)")
+        print("aggro " + " ".join(f"{b:6.2f}" for b in bluff_values))
+        for a, row in zip(aggro_values, surface):
+            print(f"{a:5d} " + " ".join(f"{w:6.3f}" for w in row))
+        total = len(aggro_values) * len(bluff_values) * args.games
+    else:
+        results = simulate(args.games, aggro, bluff, seed=args.seed)
+        elapsed = time.perf_counter() - start
+        for p in range(PLAYERS):
+            print(f"Player {p} (aggro {aggro[p]:g}, bluff {bluff[p]:g}): {(results['winner'] == p).mean():.3f} win rate")
+        print(f"Average rounds: {results['rounds'].mean():.2f}")
+        total = args.games
+    print(f"Played {total} games in {elapsed:.1f}s ({total / elapsed:,.0f} games/s)")